@@ -1,22 +1,38 @@
-import requests
-import pandas as pd
+import time
+_START_TIME = time.perf_counter()
+
+# Heavy and platform-specific modules (requests, selenium, winreg) are imported
+# where they are used, so manual runs never load Selenium and the tool starts on
+# Linux/macOS as well as Windows.
 import argparse
 import getpass
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-import time
 import json
+import csv
+import codecs
+import gzip
+import io
+import importlib.util
+import re
+import base64
+import hashlib
+import hmac
+import secrets
+import struct
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+from collections import deque
 import sys
 import os
 from pathlib import Path
 import subprocess
+import itertools
 import platform
-import winreg
+import shutil
+import tempfile
 
 # ANSI Color codes
 class Colors:
@@ -64,6 +80,200 @@ def print_info(message):
     """Print info message in cyan"""
     print(f"{Colors.CYAN}ℹ {message}{Colors.RESET}")
 
+# Startup/phase timing checkpoints, reported with --timings
+_TIMINGS = []
+_last_checkpoint = _START_TIME
+
+def record_timing(label):
+    """Record the time spent since the previous checkpoint under `label`"""
+    global _last_checkpoint
+    now = time.perf_counter()
+    _TIMINGS.append((label, now - _last_checkpoint))
+    _last_checkpoint = now
+
+def print_timings():
+    """Print the recorded timing checkpoints"""
+    print_section("Timings")
+    for label, seconds in _TIMINGS:
+        print(f"  {Colors.CYAN}{label:<32}{Colors.RESET} {Colors.WHITE}{seconds*1000:>10.1f} ms{Colors.RESET}")
+    print(f"  {Colors.BOLD}{'Total':<32} {(time.perf_counter() - _START_TIME)*1000:>10.1f} ms{Colors.RESET}")
+
+# Every RunMetrics created in this process, reported by --metrics-file
+_RUN_METRICS = []
+
+class RunMetrics:
+    """
+    Thread-safe request and export counters for one CWAOffboarding
+
+    Records request latencies, retries, errors, bytes received and token
+    refreshes (from api_get), plus per-client fetch/normalize/write time,
+    pages, bytes and result (from the ExportPipeline stages). The report
+    includes the rate controller's decisions when one is attached.
+    """
+    def __init__(self, label=None):
+        self.label = label
+        self.lock = threading.Lock()
+        self.request_latencies = []
+        self.retries = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.token_refreshes = 0
+        self.clients = {}
+        self.export_started = None
+        self.export_finished = None
+        self.rate_controller = None  # AdaptiveRateController, if requests are rate-controlled
+        _RUN_METRICS.append(self)
+
+    def record_request(self, latency, size=0, error=False):
+        with self.lock:
+            self.request_latencies.append(latency)
+            self.bytes_received += size
+            if error:
+                self.errors += 1
+
+    def record_bytes(self, size):
+        """Count body bytes read after record_request (streamed responses)"""
+        with self.lock:
+            self.bytes_received += size
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def record_refresh(self):
+        with self.lock:
+            self.token_refreshes += 1
+
+    def add_client(self, client_id, stage=None, seconds=0.0, **counts):
+        """Add `seconds` to a client's fetch/normalize/write time and add to its counters"""
+        with self.lock:
+            entry = self.clients.setdefault(str(client_id), {
+                'fetch_s': 0.0, 'normalize_s': 0.0, 'write_s': 0.0, 'pages': 0, 'bytes': 0,
+                'started': time.perf_counter(),
+            })
+            if stage:
+                entry[f"{stage}_s"] += seconds
+            for key, value in counts.items():
+                entry[key] = entry.get(key, 0) + value
+
+    def set_client(self, client_id, **fields):
+        """Record a client's name, status, rows and its wall-clock time so far"""
+        with self.lock:
+            entry = self.clients.setdefault(str(client_id), {
+                'fetch_s': 0.0, 'normalize_s': 0.0, 'write_s': 0.0, 'pages': 0, 'bytes': 0,
+                'started': time.perf_counter(),
+            })
+            entry.update(fields)
+            entry['elapsed_s'] = time.perf_counter() - entry['started']
+
+    def request_stats(self):
+        """
+        Request count, retries, errors, bytes and latency percentiles (in seconds)
+        """
+        with self.lock:
+            latencies = sorted(self.request_latencies)
+            stats = {
+                'requests': len(latencies),
+                'retries': self.retries,
+                'errors': self.errors,
+                'bytes': self.bytes_received,
+                'token_refreshes': self.token_refreshes,
+            }
+
+        if latencies:
+            stats['avg'] = sum(latencies) / len(latencies)
+            stats['p50'] = latencies[int(0.50 * (len(latencies) - 1))]
+            stats['p95'] = latencies[int(0.95 * (len(latencies) - 1))]
+            stats['p99'] = latencies[int(0.99 * (len(latencies) - 1))]
+            stats['max'] = latencies[-1]
+
+        return stats
+
+    def to_dict(self):
+        """JSON-ready report (times in seconds, latencies in milliseconds)"""
+        stats = self.request_stats()
+        requests = {key: stats[key] for key in ('requests', 'retries', 'errors', 'bytes', 'token_refreshes')}
+        requests['latency_ms'] = {key: round(stats[key] * 1000, 2) for key in ('avg', 'p50', 'p95', 'p99', 'max') if key in stats}
+
+        with self.lock:
+            entries = [{'client_id': client_id, **entry} for client_id, entry in self.clients.items()]
+
+        export = {'clients': len(entries), 'rows': sum(entry.get('rows', 0) for entry in entries)}
+        if self.export_started is not None and self.export_finished is not None:
+            export['duration_s'] = round(self.export_finished - self.export_started, 4)
+            if export['duration_s'] > 0:
+                export['clients_per_s'] = round(export['clients'] / export['duration_s'], 2)
+                export['rows_per_s'] = round(export['rows'] / export['duration_s'], 1)
+        for stage in ('fetch', 'normalize', 'write'):
+            export[f"{stage}_s"] = round(sum(entry[f"{stage}_s"] for entry in entries), 4)
+        for status in ('success', 'empty', 'unchanged', 'failed'):
+            export[status] = sum(1 for entry in entries if entry.get('status') == status)
+
+        clients = [{key: round(value, 6) if isinstance(value, float) else value
+                    for key, value in entry.items() if key != 'started'} for entry in entries]
+        report = {'base_url': self.label, 'requests': requests, 'export': export, 'clients': clients}
+        if self.rate_controller is not None:
+            report['rate_control'] = self.rate_controller.to_dict()
+        return report
+
+def write_metrics_file(metrics_file, args, exit_code):
+    """
+    Write the --metrics-file JSON report: settings, phase timings and every run's metrics
+    """
+    report = {
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'exit_code': exit_code,
+        'total_s': round(time.perf_counter() - _START_TIME, 4),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('bearer_token', 'clientid')},
+        'phases': [{'phase': label, 'seconds': round(seconds, 4)} for label, seconds in _TIMINGS],
+        'runs': [metrics.to_dict() for metrics in _RUN_METRICS],
+    }
+    try:
+        with open(metrics_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    except OSError as e:
+        print_error(f"Could not write metrics file {metrics_file}: {str(e)}")
+
+class ProgressBar:
+    """
+    One-line progress bar with throughput and ETA, redrawn in place on stderr (--progress)
+    """
+    WIDTH = 30
+
+    def __init__(self, total, stream=None):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.started = time.perf_counter()
+        self.line_length = 0
+
+    def update(self, done, rows):
+        elapsed = time.perf_counter() - self.started
+        rate = done / elapsed if elapsed > 0 else 0
+        if done >= self.total:
+            eta = "done"
+        elif rate:
+            remaining = int((self.total - done) / rate)
+            eta = f"ETA {remaining // 60}:{remaining % 60:02d}"
+        else:
+            eta = "ETA --:--"
+        filled = self.WIDTH * done // self.total if self.total else self.WIDTH
+        line = (f"  [{'#' * filled}{'.' * (self.WIDTH - filled)}] {done}/{self.total} clients, "
+                f"{rows} passwords, {rate:.1f} clients/s, {eta}")
+        self.stream.write('\r' + line.ljust(self.line_length))
+        self.stream.flush()
+        self.line_length = len(line)
+
+    def clear(self):
+        """Blank the bar so a normal line can be printed in its place"""
+        if self.line_length:
+            self.stream.write('\r' + ' ' * self.line_length + '\r')
+            self.stream.flush()
+
+    def finish(self):
+        if self.line_length:
+            self.stream.write('\n')
+            self.stream.flush()
+
 def print_section(title):
     """Print section header"""
     print(f"\n{Colors.BOLD}{Colors.MAGENTA}{'='*80}{Colors.RESET}")
@@ -89,6 +299,7 @@ def check_chrome_installed():
 
             # Also check registry
             try:
+                import winreg
                 key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows\CurrentVersion\App Paths\chrome.exe", 0, winreg.KEY_READ)
                 chrome_path = winreg.QueryValue(key, None)
                 winreg.CloseKey(key)
@@ -97,6 +308,18 @@ def check_chrome_installed():
             except:
                 pass
 
+        elif platform.system() == 'Darwin':
+            path = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
+            if os.path.exists(path):
+                return True, path
+
+        else:
+            # Linux: look for the usual Chrome/Chromium launchers on PATH
+            for name in ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser"):
+                path = shutil.which(name)
+                if path:
+                    return True, path
+
         return False, None
 
     except Exception as e:
@@ -106,10 +329,15 @@ def is_running_as_exe():
     """Check if running as PyInstaller EXE"""
     return getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS')
 
-def check_and_fix_dependencies():
+def check_and_fix_dependencies(browser_required=True):
     """Check for required dependencies and auto-fix if possible"""
     print_section("Dependency Check")
 
+    if not browser_required:
+        # Manual or non-interactive runs never open a browser, so Chrome/Selenium are optional
+        print_info("Browser login not needed - skipping Chrome and Selenium checks")
+        return True
+
     # Check for Google Chrome
     print_info("Checking for Google Chrome...")
     chrome_installed, chrome_path = check_chrome_installed()
@@ -147,8 +375,1524 @@ def check_and_fix_dependencies():
 
     return True
 
+# HTTP status codes worth retrying (throttling and transient server errors)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Automate API endpoints (relative to base_url); paging parameters are appended by iter_pages
+CLIENTS_PATH = "/cwa/api/v1/clients?includeFields=Name&orderBy=Name%20asc"
+CLIENTS_BY_CONDITION_PATH = "/cwa/api/v1/clients?includeFields=Name&condition={condition}"
+CLIENT_PATH = "/cwa/api/v1/clients/{cwclientid}?includeFields=Name"
+
+# Client IDs resolved per condition=Id in (...) query by get_clients_by_id
+CLIENT_ID_BATCH = 50
+
+# List responses are decoded as they stream in: bytes read per socket read,
+# and rows handed on per batch (so memory doesn't grow with the page size)
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_BATCH_ROWS = 1000
+
+DEPLOYMENT_LOGINS_PATH = "/cwa/api/v1/clients/{cwclientid}/deploymentlogins?condition={condition}&orderBy=title%20asc&includeFields={include_fields}"
+
+# Exportable deploymentlogins fields -> their includeFields spelling
+LOGIN_FIELDS = {"Title": "Title", "Username": "Username", "Password": "password", "Notes": "Notes", "Url": "Url"}
+
+# deploymentlogins column holding the last modification time (used by --modified-since)
+LOGIN_MODIFIED_FIELD = "LastUpdated"
+
+# Columns written for every exported password
+EXPORT_COLUMNS = ["ClientName", "ClientId", "Title", "Username", "Password", "Notes", "Url"]
+
+# Delta exports prefix each row with added/changed/removed
+DELTA_COLUMNS = ["Change"] + EXPORT_COLUMNS
+
+# Output formats (also the file extension); appendable ones can be continued by --resume
+OUTPUT_FORMATS = ["csv", "jsonl", "jsonl.gz", "jsonl.zst", "parquet", "xlsx"]
+APPENDABLE_FORMATS = ("csv", "jsonl", "jsonl.gz", "jsonl.zst")
+
+# Optional packages some output formats need: format -> (module, pip package)
+FORMAT_DEPENDENCIES = {
+    "jsonl.zst": ("zstandard", "zstandard"),
+    "parquet": ("pyarrow", "pyarrow"),
+    "xlsx": ("openpyxl", "openpyxl"),
+}
+
+# Formats whose writer spools plaintext to temporary files (openpyxl buffers
+# every worksheet in the system temp directory), so they can't be encrypted
+UNENCRYPTABLE_FORMATS = ("xlsx",)
+
+def check_output_format(output_format, encrypt=False):
+    """
+    Check an output format is known, its optional package is installed and it can be `encrypt`ed
+    """
+    if output_format not in OUTPUT_FORMATS:
+        print_error(f"Unknown output format '{output_format}' (choose from {', '.join(OUTPUT_FORMATS)})")
+        return False
+    if encrypt and output_format in UNENCRYPTABLE_FORMATS:
+        print_error(f"--encrypt can't be used with --format {output_format}: its writer puts plaintext in temporary files")
+        return False
+    module, package = FORMAT_DEPENDENCIES.get(output_format, (None, None))
+    if module and importlib.util.find_spec(module) is None:
+        print_error(f"--format {output_format} needs the {package} package: pip install {package}")
+        return False
+    return True
+
+class Client:
+    """Compact client record (Id and Name) used throughout selection and export"""
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __repr__(self):
+        return f"Client(id={self.id!r}, name={self.name!r})"
+
+def _trigrams(text):
+    """Trigrams of each word in `text`, padded so word starts and ends count too"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class ClientSearchIndex:
+    """
+    In-memory search index over client names and IDs
+
+    Built once per client list. Lookups use a trigram index to find substring
+    matches without scanning every name, fall back to trigram similarity for
+    typos, and rank results: exact ID, exact name, name prefix, word prefix,
+    substring, then fuzzy matches by score.
+    """
+    # Share of the query's trigrams a name must contain to count as a fuzzy match
+    FUZZY_THRESHOLD = 0.6
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.names = [client.name.lower() for client in clients]
+        self.by_id = {str(client.id): position for position, client in enumerate(clients)}
+        self.postings = {}
+        for position, name in enumerate(self.names):
+            for gram in _trigrams(name):
+                self.postings.setdefault(gram, []).append(position)
+
+    def get(self, client_id):
+        """Client with the given ID, or None"""
+        position = self.by_id.get(str(client_id).strip().lstrip('#'))
+        return self.clients[position] if position is not None else None
+
+    def _substring_candidates(self, term):
+        """Positions whose names may contain `term` (all of them for very short terms)"""
+        # Only trigrams inside a word are guaranteed to be in the index
+        grams = {word[i:i + 3] for word in term.split() for i in range(len(word) - 2)}
+        if not grams:
+            return range(len(self.names))
+
+        postings = sorted((self.postings.get(gram, []) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, search_term):
+        """Clients matching `search_term`, best matches first"""
+        term = " ".join(search_term.lower().split())
+        if not term:
+            return list(self.clients)
+
+        ranks = {}
+
+        id_position = self.by_id.get(term.lstrip('#'))
+        if id_position is not None:
+            ranks[id_position] = (0, 0)
+
+        for position in self._substring_candidates(term):
+            name = self.names[position]
+            found = name.find(term)
+            if found < 0 or position in ranks:
+                continue
+            if name == term:
+                ranks[position] = (1, 0)
+            elif found == 0:
+                ranks[position] = (2, 0)
+            elif f" {term}" in name:
+                ranks[position] = (3, 0)
+            else:
+                ranks[position] = (4, 0)
+
+        # Typo tolerance: names sharing most of the query's trigrams
+        query_grams = _trigrams(term)
+        if len(term) >= 3 and query_grams:
+            shared = {}
+            for gram in query_grams:
+                for position in self.postings.get(gram, ()):
+                    shared[position] = shared.get(position, 0) + 1
+            for position, count in shared.items():
+                score = count / len(query_grams)
+                if score >= self.FUZZY_THRESHOLD and position not in ranks:
+                    ranks[position] = (5, -score)
+
+        return [self.clients[position] for position in sorted(ranks, key=lambda position: (ranks[position], position))]
+
+class APIError(Exception):
+    """Raised when the Automate API answers with an unexpected status code"""
+    def __init__(self, response):
+        super().__init__(f"Status {response.status_code}")
+        self.status_code = response.status_code
+        self.response = response
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+def iter_json_array(chunks):
+    """
+    Yield the elements of a JSON array as its bytes arrive from `chunks`
+
+    Elements are decoded one at a time with JSONDecoder.raw_decode, so only
+    the not-yet-decoded tail of the body is held in memory instead of the
+    whole response plus the whole list. Raises ValueError if the body is
+    not a (complete) JSON array.
+    """
+    raw_decode = json.JSONDecoder().raw_decode
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer, pos = '', 0
+    state = 'start'  # start -> first -> (sep -> value)* -> end
+    done = False
+
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            done = True
+            buffer = buffer[pos:] + decoder.decode(b'', final=True)
+        else:
+            buffer = buffer[pos:] + decoder.decode(chunk)
+        pos = 0
+
+        while True:
+            pos = _JSON_WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if state == 'start':
+                if buffer[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+                pos += 1
+                state = 'first'
+            elif state == 'sep':
+                if buffer[pos] not in ',]':
+                    raise ValueError(f"Expected ',' or ']' at offset {pos}")
+                state = 'value' if buffer[pos] == ',' else 'end'
+                pos += 1
+            elif state == 'first' and buffer[pos] == ']':
+                pos += 1
+                state = 'end'
+            elif state in ('first', 'value'):
+                try:
+                    item, end = raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if done:
+                        raise
+                    break  # Element continues in the next chunk
+                if not done and (end == len(buffer) or buffer[end] not in ', \t\n\r]'):
+                    break  # A number might continue in the next chunk (e.g. "12" of "12.5")
+                yield item
+                pos = end
+                state = 'sep'
+                if buffer.startswith(',', pos):  # Fast path for the usual "},{"
+                    pos += 1
+                    state = 'value'
+            else:
+                raise ValueError("Unexpected data after the JSON array")
+
+    if state != 'end':
+        raise ValueError("Truncated JSON array")
+
+class OutputDirectory:
+    """Hands out unused export file names and publishes finished files atomically (fsync + hard link)"""
+    TEMP_SUFFIX = '.part'
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        # Case-insensitive, as on Windows and macOS
+        self.taken = {entry.name.lower() for entry in os.scandir(self.directory)}
+        self.names = {}  # Allocated path -> (stem, extension), to pick the next name on a late clash
+        self.committed = []
+        self.lock = threading.Lock()
+
+    def allocate(self, stem, extension):
+        """Reserve `stem`.`extension`, or the first free `stem`_N.`extension`; returns the path"""
+        with self.lock:
+            name = f"{stem}.{extension}"
+            counter = 1
+            while name.lower() in self.taken:
+                name = f"{stem}_{counter}.{extension}"
+                counter += 1
+            self.taken.add(name.lower())
+            self.names[str(self.directory / name)] = (stem, extension)
+            return self.directory / name
+
+    def temp_path(self, path):
+        """Hidden scratch file next to `path` to write it under"""
+        return Path(path).with_name(f".{Path(path).name}.{secrets.token_hex(4)}{self.TEMP_SUFFIX}")
+
+    @staticmethod
+    def _fsync(path):
+        """Flush a file's data to disk"""
+        fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def commit(self, temp_file, path):
+        """Publish a finished temporary file under `path` without replacing anything; returns the final path"""
+        self._fsync(temp_file)
+        while True:
+            try:
+                os.link(temp_file, path)
+            except FileExistsError:
+                pass
+            except OSError:
+                # No hard links on this filesystem (e.g. FAT or some network shares): check, then rename
+                if not os.path.exists(path):
+                    os.replace(temp_file, path)
+                    break
+            else:
+                os.remove(temp_file)
+                break
+            # Someone created the file after the directory was listed; use the next free name
+            stem, extension = self.names.get(str(path)) or (Path(path).stem, Path(path).suffix.lstrip('.'))
+            path = self.allocate(stem, extension)
+        with self.lock:
+            self.committed.append(path)
+        return str(path)
+
+    def sync(self):
+        """Flush the directory entries of every file committed so far to disk; returns the number of files"""
+        with self.lock:
+            committed, self.committed = self.committed, []
+        if committed and os.name != 'nt':
+            # Makes the new names durable (directories can't be opened on Windows)
+            self._fsync(self.directory)
+        return len(committed)
+
+class ExportWriter:
+    """
+    Appends export rows (tuples in `columns` order) to a single output file
+
+    Formats: CSV, JSONL (plain, gzip or zstd compressed), Parquet and XLSX.
+    The file is only created when the first rows arrive and the CSV header is
+    written once, so the same writer can be shared by several clients.
+    With `append`, rows are added to an existing file (e.g. a resumed export);
+    Parquet and XLSX files cannot be appended to and are rewritten.
+    Parquet rows are buffered into row groups of PARQUET_ROW_GROUP rows. XLSX
+    files get one worksheet per client, streamed with openpyxl's write-only mode.
+    With an ExportEncryption, every byte of the file passes through an
+    EncryptedFile on its way to disk (encrypted files are never appended to).
+    XLSX can't be encrypted: openpyxl spools worksheets to plaintext
+    temporary files (see UNENCRYPTABLE_FORMATS). With an OutputDirectory, a
+    new file is written under a temporary name and only published once it is
+    complete, as `output_file` or, if that name was taken meanwhile, the
+    next free one.
+    """
+    PARQUET_ROW_GROUP = 50000
+    GZIP_LEVEL = 6
+
+    def __init__(self, output_file, output_format='csv', append=False, columns=EXPORT_COLUMNS, encryption=None,
+                 output_directory=None):
+        if encryption and output_format in UNENCRYPTABLE_FORMATS:
+            raise ValueError(f"{output_format} exports can't be encrypted")
+        self.requested_file = output_file
+        self.append = append
+        self.encryption = encryption
+        self.output_directory = output_directory
+        self.temp_file = None
+        self.columns = columns
+        self.output_file = None
+        self.output_format = output_format
+        self.rows_written = 0
+        self.handle = None
+        self.sink = None
+        self.stream = None
+        self.csv_writer = None
+        self.parquet_writer = None
+        self.parquet_rows = []
+        self.workbook = None
+        self.sheets = {}
+        self.lock = threading.Lock()
+
+    def _open(self):
+        """Create the file and set up the encoder for the output format"""
+        fmt = self.output_format
+        appending = (self.append and fmt in APPENDABLE_FORMATS and not self.encryption
+                     and os.path.exists(self.requested_file) and os.path.getsize(self.requested_file) > 0)
+        mode = 'a' if appending else 'w'
+
+        # Appends go straight to the existing file; anything new is written aside and renamed on close
+        path = self.requested_file
+        if self.output_directory is not None and not appending:
+            self.temp_file = path = self.output_directory.temp_path(self.requested_file)
+
+        if fmt in ('csv', 'jsonl') and not self.encryption:
+            self.handle = open(path, mode, newline='', encoding='utf-8')
+            self.sink = self.stream = self.handle
+        else:
+            self.handle = open(path, mode + 'b')
+            self.sink = self.encryption.open(self.handle) if self.encryption else self.handle
+        self.output_file = str(self.requested_file)
+
+        # Appending adds a new gzip member / zstd frame; both decompress as one stream
+        if fmt in ('csv', 'jsonl') and self.encryption:
+            self.stream = io.TextIOWrapper(self.sink, encoding='utf-8', newline='')
+        elif fmt == 'jsonl.gz':
+            compressor = gzip.GzipFile(fileobj=self.sink, mode='wb', compresslevel=self.GZIP_LEVEL)
+            self.stream = io.TextIOWrapper(compressor, encoding='utf-8', newline='')
+        elif fmt == 'jsonl.zst':
+            import zstandard
+            compressor = zstandard.ZstdCompressor().stream_writer(self.sink)
+            self.stream = io.TextIOWrapper(compressor, encoding='utf-8', newline='')
+        elif fmt == 'parquet':
+            import pyarrow
+            import pyarrow.parquet
+            schema = pyarrow.schema([(column, pyarrow.int64() if column == 'ClientId' else pyarrow.string())
+                                     for column in self.columns])
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(self.sink, schema, compression='zstd')
+        elif fmt == 'xlsx':
+            import openpyxl
+            self.workbook = openpyxl.Workbook(write_only=True)
+
+        if fmt == 'csv':
+            self.csv_writer = csv.writer(self.stream)
+            if not appending:
+                self.csv_writer.writerow(self.columns)
+
+    def write(self, rows):
+        """Append a list of export rows"""
+        with self.lock:
+            if self.handle is None:
+                self._open()
+
+            fmt = self.output_format
+            if fmt == 'csv':
+                self.csv_writer.writerows(rows)
+            elif fmt == 'parquet':
+                self.parquet_rows.extend(rows)
+                if len(self.parquet_rows) >= self.PARQUET_ROW_GROUP:
+                    self._flush_parquet()
+            elif fmt == 'xlsx':
+                self._write_xlsx(rows)
+            else:
+                self.stream.writelines(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False, separators=(',', ':')) + '\n' for row in rows)
+
+            self.rows_written += len(rows)
+
+    def _flush_parquet(self):
+        """Write the buffered rows as one Parquet row group"""
+        if not self.parquet_rows:
+            return
+        import pyarrow
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array(list(values), type=field.type) for values, field in zip(zip(*self.parquet_rows), self.parquet_writer.schema)],
+            schema=self.parquet_writer.schema)
+        self.parquet_writer.write_table(table)
+        self.parquet_rows = []
+
+    def _write_xlsx(self, rows):
+        """Append rows to the worksheet of the client they belong to"""
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        id_index = self.columns.index('ClientId')
+        name_index = self.columns.index('ClientName')
+        for row in rows:
+            sheet = self.sheets.get(row[id_index])
+            if sheet is None:
+                # Sheet names: max 31 characters, no []:*?/\ and unique
+                title = re.sub(r'[\[\]:*?/\\]', '', str(row[name_index] or row[id_index]))[:31] or 'Sheet'
+                taken = {ws.title for ws in self.sheets.values()}
+                counter = 2
+                while title in taken:
+                    suffix = f" ({counter})"
+                    title = title[:31 - len(suffix)] + suffix
+                    counter += 1
+                sheet = self.workbook.create_sheet(title)
+                sheet.append(self.columns)
+                self.sheets[row[id_index]] = sheet
+
+            cells = []
+            for value in row:
+                if isinstance(value, str):
+                    value = ILLEGAL_CHARACTERS_RE.sub('', value)
+                    if value.startswith('='):
+                        # Store passwords like "=abc" as text, not as a formula
+                        cell = WriteOnlyCell(sheet, value)
+                        cell.data_type = 's'
+                        value = cell
+                cells.append(value)
+            sheet.append(cells)
+
+    def close(self, finalize=True):
+        """Finish the file and move it into place (without `finalize`, just release it)"""
+        with self.lock:
+            if self.handle is None or self.handle.closed:
+                return
+            self._close(finalize)
+            if finalize and self.temp_file is not None:
+                self.output_file = self.output_directory.commit(self.temp_file, self.output_file)
+                self.temp_file = None
+
+    def _close(self, finalize):
+        """Flush the encoder stack and close the file handle"""
+        try:
+            if self.parquet_writer is not None:
+                if finalize:
+                    self._flush_parquet()
+                self.parquet_writer.close()
+            elif self.workbook is not None:
+                if finalize:
+                    # Sheets are created as clients finish; save them in name order
+                    for position, sheet in enumerate(sorted(self.sheets.values(), key=lambda ws: ws.title.lower())):
+                        self.workbook.move_sheet(sheet.title, position - self.workbook.index(sheet))
+                    self.workbook.save(self.sink)
+            elif self.stream is not self.handle:
+                self.stream.close()
+            if self.sink is not self.handle:
+                # Writes the final, authenticated chunk
+                self.sink.close()
+        finally:
+            self.handle.close()
+
+    def discard(self):
+        """Close and delete a partially written file"""
+        self.close(finalize=False)
+        partial = self.temp_file or self.output_file
+        if partial and os.path.exists(partial):
+            os.remove(partial)
+        self.temp_file = None
+
+class EncryptedFile(io.RawIOBase):
+    """
+    Write-only file object that encrypts everything written to it before it reaches `raw`
+
+    Data is cut into chunks of `chunk_size` bytes, each sealed with AES-GCM
+    under a nonce of prefix || chunk counter || last-chunk flag (the STREAM
+    construction), so chunks can't be reordered, dropped or truncated
+    unnoticed. Every chunk is stored as a 4-byte length and the ciphertext;
+    the file header is authenticated as associated data of each chunk.
+    tell() reports plaintext bytes, which is all zip (XLSX) and Parquet need.
+    """
+    def __init__(self, raw, key, header, nonce_prefix, chunk_size):
+        super().__init__()
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self.raw = raw
+        self.aead = AESGCM(key)
+        self.header = header
+        self.nonce_prefix = nonce_prefix
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.counter = 0
+        self.position = 0
+        raw.write(header)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.chunk_size:
+            self._seal(bytes(self.buffer[:self.chunk_size]), last=False)
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def _seal(self, chunk, last):
+        nonce = self.nonce_prefix + struct.pack('>I?', self.counter, last)
+        ciphertext = self.aead.encrypt(nonce, chunk, self.header)
+        self.raw.write(struct.pack('>I', len(ciphertext)) + ciphertext)
+        self.counter += 1
+
+    def close(self):
+        """Seal the remaining data as the last chunk (the raw file stays open)"""
+        if not self.closed:
+            self._seal(bytes(self.buffer), last=True)
+            self.buffer.clear()
+            self.raw.flush()
+        super().close()
+
+class ExportEncryption:
+    """
+    Passphrase-based encryption for export files (written with the .enc suffix)
+
+    The passphrase is stretched once per run with scrypt; each file then gets
+    its own key, HMAC-SHA256(master key, random file salt), so encrypting
+    thousands of per-client files costs one slow key derivation. The header
+    records everything decrypt_file() needs except the passphrase:
+    MAGIC, scrypt salt, log2(N), r, p, file salt, nonce prefix and chunk size.
+    """
+    MAGIC = b'CWAENC1\n'
+    SUFFIX = '.enc'
+    CHUNK_SIZE = 64 * 1024
+    SCRYPT_LOG_N = 15
+    SCRYPT_R = 8
+    SCRYPT_P = 1
+    _HEADER = struct.Struct('>8s16sBBB16s7sI')
+
+    _master_keys = {}  # (passphrase, salt, params) -> key, so decrypting a run's files derives once
+    _keys_lock = threading.Lock()
+
+    def __init__(self, passphrase):
+        self.passphrase = passphrase
+        self.salt = secrets.token_bytes(16)
+        self.master_key = self._master_key(passphrase, self.salt, self.SCRYPT_LOG_N, self.SCRYPT_R, self.SCRYPT_P)
+
+    @classmethod
+    def _master_key(cls, passphrase, salt, log_n, r, p):
+        cache_key = (passphrase, salt, log_n, r, p)
+        with cls._keys_lock:
+            if cache_key not in cls._master_keys:
+                cls._master_keys[cache_key] = hashlib.scrypt(passphrase.encode('utf-8'), salt=salt, n=2 ** log_n,
+                                                             r=r, p=p, maxmem=256 * 1024 * 1024, dklen=32)
+            return cls._master_keys[cache_key]
+
+    def open(self, raw):
+        """Start an encrypted stream on the binary file `raw`"""
+        file_salt = secrets.token_bytes(16)
+        nonce_prefix = secrets.token_bytes(7)
+        header = self._HEADER.pack(self.MAGIC, self.salt, self.SCRYPT_LOG_N, self.SCRYPT_R, self.SCRYPT_P,
+                                   file_salt, nonce_prefix, self.CHUNK_SIZE)
+        key = hmac.new(self.master_key, b'cwa-export-file' + file_salt, hashlib.sha256).digest()
+        return EncryptedFile(raw, key, header, nonce_prefix, self.CHUNK_SIZE)
+
+    @classmethod
+    def decrypt_file(cls, encrypted_file, output_file, passphrase):
+        """
+        Decrypt an .enc export into `output_file`, chunk by chunk
+
+        Raises ValueError for a wrong passphrase or a damaged/truncated file;
+        the partial output is removed in that case.
+        """
+        from cryptography.exceptions import InvalidTag
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        with open(encrypted_file, 'rb') as source:
+            header = source.read(cls._HEADER.size)
+            if len(header) != cls._HEADER.size or not header.startswith(cls.MAGIC):
+                raise ValueError("not an encrypted export file")
+            _, salt, log_n, r, p, file_salt, nonce_prefix, _ = cls._HEADER.unpack(header)
+            master_key = cls._master_key(passphrase, salt, log_n, r, p)
+            aead = AESGCM(hmac.new(master_key, b'cwa-export-file' + file_salt, hashlib.sha256).digest())
+
+            try:
+                with open(output_file, 'wb') as target:
+                    counter = 0
+                    while True:
+                        length = source.read(4)
+                        if len(length) != 4:
+                            raise ValueError("file is truncated")
+                        ciphertext = source.read(struct.unpack('>I', length)[0])
+                        # Only the final chunk authenticates with the last-chunk flag set
+                        for last in (False, True):
+                            try:
+                                target.write(aead.decrypt(nonce_prefix + struct.pack('>I?', counter, last), ciphertext, header))
+                                break
+                            except InvalidTag:
+                                if last:
+                                    raise ValueError("wrong passphrase or damaged file") from None
+                        counter += 1
+                        if last:
+                            if source.read(1):
+                                raise ValueError("unexpected data after the last chunk")
+                            return
+            except Exception:
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+                raise
+
+def get_export_passphrase(non_interactive=False):
+    """
+    Passphrase for --encrypt: CWA_EXPORT_PASSPHRASE, else asked for twice
+
+    Returns None when none is available (or the two entries differ).
+    """
+    passphrase = os.environ.get('CWA_EXPORT_PASSPHRASE')
+    if passphrase or non_interactive:
+        return passphrase or None
+
+    passphrase = getpass.getpass(f"{Colors.CYAN}Export passphrase: {Colors.RESET}")
+    if not passphrase:
+        return None
+    if getpass.getpass(f"{Colors.CYAN}Repeat passphrase: {Colors.RESET}") != passphrase:
+        print_error("Passphrases do not match")
+        return None
+    return passphrase
+
+class ExportJournal:
+    """
+    Append-only progress journal (JSON lines) of per-client export results
+
+    Kept in the output directory so an interrupted export can be restarted
+    with --resume, skipping the clients that already finished.
+    """
+    FILENAME = '.cwa_export_journal.jsonl'
+
+    def __init__(self, output_dir, base_url):
+        self.path = Path(output_dir) / self.FILENAME
+        self.base_url = base_url
+        self.lock = threading.Lock()
+
+    def _read(self):
+        """All parseable journal entries"""
+        if not self.path.exists():
+            return []
+        entries = []
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # e.g. a line cut short by a crash
+        return entries
+
+    def completed(self):
+        """Latest entry per client ID (as a string) for clients that finished on this base URL"""
+        latest = {}
+        for entry in self._read():
+            if entry.get('base_url') == self.base_url:
+                latest[str(entry.get('client_id'))] = entry
+        return {client_id: entry for client_id, entry in latest.items() if entry.get('status') in ('success', 'empty', 'unchanged')}
+
+    def reset(self):
+        """Start a fresh run by forgetting this base URL's entries"""
+        with self.lock:
+            others = [entry for entry in self._read() if entry.get('base_url') != self.base_url]
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry) + '\n' for entry in others)
+
+    def record(self, client_id, client_name, status, rows, output_file, combined=False):
+        """Append one client's result"""
+        entry = {
+            'base_url': self.base_url,
+            'client_id': client_id,
+            'client_name': client_name,
+            'status': status,
+            'rows': rows,
+            'file': output_file,
+            'combined': combined,
+            'time': datetime.now().isoformat(timespec='seconds'),
+        }
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+class DeltaIndex:
+    """Salted (HMAC) fingerprints of each client's rows from the previous export, for --delta runs"""
+    FILENAME = '.cwa_fingerprints.json'
+
+    def __init__(self, output_dir, base_url):
+        self.path = Path(output_dir) / self.FILENAME
+        self.base_url = base_url
+        self.lock = threading.Lock()
+
+        data = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding='utf-8'))
+            except ValueError:
+                print_warning(f"Ignoring unreadable fingerprint index {self.path}")
+        self.data = data
+        self.salt = bytes.fromhex(data.setdefault('salt', secrets.token_hex(16)))
+        self.clients = data.setdefault('servers', {}).setdefault(base_url, {})
+
+    def previous(self, client_id):
+        """{row key: [fingerprint, Title, Username, Url]} from the last run (empty if new)"""
+        with self.lock:
+            return dict(self.clients.get(str(client_id), {}))
+
+    def _fingerprint(self, row):
+        """Keyed hash of everything but the client name/ID"""
+        payload = json.dumps(row[2:], default=str).encode('utf-8')
+        return hmac.new(self.salt, payload, hashlib.sha256).hexdigest()[:32]
+
+    def diff(self, rows, previous, current):
+        """
+        Return the rows that are new or changed since `previous` (with a Change column)
+
+        Every row is also recorded in `current`, the client's new fingerprints.
+        """
+        changes = []
+        for row in rows:
+            title, username, url = row[2], row[3], row[6]
+            key = json.dumps([title, username, url])
+            # Duplicate Title/Username/Url rows get numbered keys
+            duplicate = 1
+            base_key = key
+            while key in current:
+                duplicate += 1
+                key = f"{base_key}#{duplicate}"
+
+            fingerprint = self._fingerprint(row)
+            current[key] = [fingerprint, title, username, url]
+
+            if key not in previous:
+                changes.append(('added',) + tuple(row))
+            elif previous[key][0] != fingerprint:
+                changes.append(('changed',) + tuple(row))
+        return changes
+
+    def removed(self, previous, current, client_name, client_id):
+        """Rows from `previous` that are gone, with only their key columns filled in"""
+        return [
+            ('removed', client_name, client_id, title, username, None, None, url)
+            for key, (_, title, username, url) in previous.items()
+            if key not in current
+        ]
+
+    def update(self, client_id, current):
+        """Replace a client's fingerprints after a successful export"""
+        with self.lock:
+            self.clients[str(client_id)] = current
+
+    def save(self):
+        """Atomically write the index back to disk"""
+        with self.lock:
+            temp_file = self.path.with_suffix('.tmp')
+            temp_file.write_text(json.dumps(self.data), encoding='utf-8')
+            os.replace(temp_file, self.path)
+
+class LoginQuery:
+    """
+    Server-side filter and field projection for deploymentlogins requests
+
+    --title-match, --url-domain and --modified-since compile into an Automate
+    `condition` expression and --fields into `includeFields`, so the server
+    only sends (and we only parse) the rows and columns that are wanted.
+    The default query fetches every row with all LOGIN_FIELDS.
+    """
+    def __init__(self, title_match=None, url_domain=None, modified_since=None, fields=None):
+        self.fields = list(fields or LOGIN_FIELDS)
+        self.columns = ["ClientName", "ClientId"] + self.fields
+
+        clauses = []
+        if title_match:
+            clauses.append(f"Title like '%{self._literal(title_match)}%'")
+        if url_domain:
+            clauses.append(f"Url like '%{self._literal(url_domain)}%'")
+        if modified_since:
+            clauses.append(f"{LOGIN_MODIFIED_FIELD} >= '{modified_since.strftime('%Y-%m-%dT%H:%M:%S')}'")
+        self.condition = ' and '.join(clauses)
+
+    @staticmethod
+    def _literal(value):
+        """Escape a value for a single-quoted condition string"""
+        return value.replace("'", "''")
+
+    @property
+    def is_default(self):
+        return not self.condition and self.fields == list(LOGIN_FIELDS)
+
+    def path(self, cwclientid):
+        """deploymentlogins path for one client"""
+        return DEPLOYMENT_LOGINS_PATH.format(cwclientid=cwclientid, condition=quote(self.condition),
+                                             include_fields=','.join(LOGIN_FIELDS[field] for field in self.fields))
+
+def build_login_query(title_match=None, url_domain=None, modified_since=None, fields=None):
+    """
+    Check the filter/projection options and build a LoginQuery, or return None after printing why
+
+    `modified_since` is an ISO date or date-time string; `fields` a comma-separated
+    string or list of LOGIN_FIELDS names (any case).
+    """
+    since = None
+    if modified_since:
+        try:
+            since = datetime.fromisoformat(str(modified_since))
+        except ValueError:
+            print_error(f"Invalid --modified-since '{modified_since}' (use YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS)")
+            return None
+
+    selected = None
+    if fields:
+        names = {name.lower(): name for name in LOGIN_FIELDS}
+        requested = fields.split(',') if isinstance(fields, str) else fields
+        selected = []
+        for field in requested:
+            name = names.get(str(field).strip().lower())
+            if name is None:
+                print_error(f"Unknown field '{str(field).strip()}' (choose from {', '.join(LOGIN_FIELDS)})")
+                return None
+            if name not in selected:
+                selected.append(name)
+
+    return LoginQuery(title_match, url_domain, since, selected)
+
+class RowSpool:
+    """
+    Holds one client's rows until the client is done (used for combined exports)
+
+    A client that fails part-way through must not leave rows in the shared
+    file, or a resumed export would add them a second time. Up to MEMORY_ROWS
+    rows stay in memory; beyond that they are spilled in batches to an
+    anonymous temporary file in `directory`. With `encrypted`, every batch is
+    sealed with AES-GCM under a random key that never leaves memory, so an
+    encrypted export leaves no plaintext on disk.
+    """
+    MEMORY_ROWS = 20000
+
+    def __init__(self, directory, encrypted=False):
+        self.directory = directory
+        self.aead = None
+        if encrypted:
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+            self.aead = AESGCM(AESGCM.generate_key(bit_length=256))
+        self.rows = []
+        self.file = None
+        self.spilled = 0  # Batches in the spill file
+
+    def add(self, rows):
+        """Hold on to a list of export rows"""
+        self.rows.extend(rows)
+        if len(self.rows) >= self.MEMORY_ROWS:
+            self._spill()
+
+    def _spill(self):
+        """Move the rows held in memory to the spill file"""
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(prefix='.cwa_spool_', dir=self.directory)
+        data = json.dumps(self.rows, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if self.aead is not None:
+            data = self.aead.encrypt(struct.pack('>4xQ', self.spilled), data, None)
+        self.file.write(struct.pack('>I', len(data)) + data)
+        self.spilled += 1
+        self.rows = []
+
+    def batches(self):
+        """Yield the held rows in batches, in the order they were added"""
+        if self.file is not None:
+            self.file.seek(0)
+            for counter in range(self.spilled):
+                data = self.file.read(struct.unpack('>I', self.file.read(4))[0])
+                if self.aead is not None:
+                    data = self.aead.decrypt(struct.pack('>4xQ', counter), data, None)
+                yield json.loads(data)
+        if self.rows:
+            yield self.rows
+
+    def close(self):
+        """Drop the held rows and remove the spill file"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.rows = []
+
+class ExportPipeline:
+    """
+    Exports clients through fetch -> normalize -> write threads joined by bounded queues
+
+    run() yields (task, (status, detail, saved_file, rows_written)) in task order
+    """
+    PAGES_PER_WORKER = 2  # Queue depth per fetch worker
+
+    _STOP = object()
+
+    def __init__(self, offboarding, tasks, workers=1, shared_writer=False, delta_index=None, login_query=None,
+                 journal=None):
+        self.offboarding = offboarding
+        self.tasks = tasks
+        self.login_query = login_query or LoginQuery()
+        self.workers = max(1, workers)
+        self.shared_writer = shared_writer
+        self.delta_index = delta_index
+        self.journal = journal
+
+        self.task_queue = queue.Queue()
+        for index in range(len(tasks)):
+            self.task_queue.put(index)
+        self.normalize_queue = queue.Queue(maxsize=self.workers * self.PAGES_PER_WORKER)
+        self.write_queue = queue.Queue(maxsize=self.workers * self.PAGES_PER_WORKER)
+
+        self.stop = threading.Event()
+        self.failed = set()  # Tasks already failed downstream; their remaining pages are dropped
+        self.spools = {}  # Task index -> RowSpool of rows held back from the shared writer
+        self.results = [None] * len(tasks)
+        self.done = [threading.Event() for _ in tasks]
+
+    def run(self):
+        """Run the pipeline, yielding (task, result) in task order as results become available"""
+        fetchers = [threading.Thread(target=self._fetch_stage, daemon=True) for _ in range(self.workers)]
+        normalizer = threading.Thread(target=self._normalize_stage, daemon=True)
+        writer = threading.Thread(target=self._write_stage, daemon=True)
+        for thread in fetchers + [normalizer, writer]:
+            thread.start()
+
+        try:
+            for index, task in enumerate(self.tasks):
+                # Short waits keep Ctrl+C responsive
+                while not self.done[index].wait(0.2):
+                    pass
+                yield task, self.results[index]
+        finally:
+            # On an interrupt, fetchers stop after their current page and the
+            # downstream stages drain what is queued before shutting down
+            self.stop.set()
+            for thread in fetchers:
+                thread.join()
+            self.normalize_queue.put(self._STOP)
+            normalizer.join()
+            writer.join()
+
+    def _fetch_stage(self):
+        """Download pages for queued clients until there are none left"""
+        while not self.stop.is_set():
+            try:
+                index = self.task_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            cwclientid = self.tasks[index][0]
+            metrics = self.offboarding.metrics
+            transfer = {}
+            metrics.add_client(cwclientid)  # Starts the client's wall-clock time
+            try:
+                started = time.perf_counter()
+                for passwords in self.offboarding.iter_pages(self.login_query.path(cwclientid), transfer=transfer):
+                    metrics.add_client(cwclientid, 'fetch', time.perf_counter() - started,
+                                       pages=transfer.pop('pages', 0), bytes=transfer.pop('bytes', 0))
+                    if self.stop.is_set() or index in self.failed:
+                        break
+                    self.normalize_queue.put(('page', index, passwords))
+                    # Time blocked on a full queue is backpressure, not fetching
+                    started = time.perf_counter()
+                metrics.add_client(cwclientid, 'fetch', time.perf_counter() - started,
+                                   pages=transfer.pop('pages', 0), bytes=transfer.pop('bytes', 0))
+
+                if self.stop.is_set():
+                    self.normalize_queue.put(('error', index, "Interrupted"))
+                else:
+                    self.normalize_queue.put(('done', index, None))
+
+            except APIError as e:
+                self.normalize_queue.put(('error', index, f"Failed - Status {e.status_code}"))
+
+            except Exception as e:
+                self.normalize_queue.put(('error', index, f"Error: {str(e)}"))
+
+    def _normalize_stage(self):
+        """Turn raw pages into export rows (or delta rows) and pass them on to the writer"""
+        state = {}
+        while True:
+            item = self.normalize_queue.get()
+            if item is self._STOP:
+                self.write_queue.put(self._STOP)
+                return
+
+            kind, index, payload = item
+            if index in self.failed:
+                continue
+            cwclientid, client_name, _ = self.tasks[index]
+            if index not in state:
+                state[index] = {
+                    'passwords': 0,
+                    'changes': {'added': 0, 'changed': 0, 'removed': 0},
+                    'previous': self.delta_index.previous(cwclientid) if self.delta_index else None,
+                    'current': {},
+                }
+            client_state = state[index]
+
+            started = time.perf_counter()
+            try:
+                if kind == 'page':
+                    rows = self.offboarding._export_rows(payload, client_name, self.login_query.fields)
+                    client_state['passwords'] += len(rows)
+                    if self.delta_index is not None:
+                        rows = self.delta_index.diff(rows, client_state['previous'], client_state['current'])
+                        for row in rows:
+                            client_state['changes'][row[0]] += 1
+                    self.offboarding.metrics.add_client(cwclientid, 'normalize', time.perf_counter() - started)
+                    if rows:
+                        self.write_queue.put(('rows', index, rows))
+
+                elif kind == 'done':
+                    if self.delta_index is not None:
+                        removed = self.delta_index.removed(client_state['previous'], client_state['current'], client_name, cwclientid)
+                        if removed:
+                            client_state['changes']['removed'] = len(removed)
+                            self.write_queue.put(('rows', index, removed))
+                    del state[index]
+                    self.write_queue.put(('done', index, client_state))
+
+                else:
+                    del state[index]
+                    self.write_queue.put(('error', index, payload))
+
+            except Exception as e:
+                state.pop(index, None)
+                self.failed.add(index)
+                self.write_queue.put(('error', index, f"Error: {str(e)}"))
+
+    def _write_stage(self):
+        """Append rows to the output files and settle each client's result"""
+        rows_written = {}
+        while True:
+            item = self.write_queue.get()
+            if item is self._STOP:
+                break
+
+            kind, index, payload = item
+            if self.done[index].is_set():
+                continue
+            try:
+                self._write_item(kind, index, payload, rows_written)
+            except Exception as e:
+                # One client's error must not strand the clients queued behind it
+                rows_written.pop(index, None)
+                if not self.done[index].is_set():
+                    self._finish(index, ('failed', f"Error: {str(e)}", None, 0))
+
+        # Clients cut off by an interrupt never finished; don't leave their partial files behind
+        for index in range(len(self.tasks)):
+            if not self.done[index].is_set():
+                self._finish(index, ('failed', "Interrupted", None, 0))
+
+    def _write_item(self, kind, index, payload, rows_written):
+        """Handle one write queue item of a client that has not settled yet"""
+        cwclientid, _, writer = self.tasks[index]
+
+        if kind == 'rows' or (kind == 'done' and index in self.spools):
+            started = time.perf_counter()
+            try:
+                if kind == 'done':
+                    # The client is complete: hand its held rows to the shared writer (_finish drops the spool)
+                    for rows in self.spools[index].batches():
+                        writer.write(rows)
+                        rows_written[index] = rows_written.get(index, 0) + len(rows)
+                elif self.shared_writer:
+                    if index not in self.spools:
+                        self.spools[index] = RowSpool(Path(writer.requested_file).parent, encrypted=bool(writer.encryption))
+                    self.spools[index].add(payload)
+                else:
+                    writer.write(payload)
+                    rows_written[index] = rows_written.get(index, 0) + len(payload)
+                self.offboarding.metrics.add_client(cwclientid, 'write', time.perf_counter() - started)
+            except PermissionError:
+                self._finish(index, ('failed', "Permission denied - file may be open", None, 0))
+                return
+            except Exception as e:
+                self._finish(index, ('failed', f"Error saving: {str(e)}", None, 0))
+                return
+
+        if kind == 'done':
+            written = rows_written.pop(index, 0)
+            if self.delta_index is not None and not written:
+                result = ('unchanged', f"No changes ({payload['passwords']} passwords)", None, 0)
+            elif self.delta_index is not None:
+                changes = payload['changes']
+                detail = f"{changes['added']} added, {changes['changed']} changed, {changes['removed']} removed"
+                result = ('success', detail, writer.output_file, written)
+            elif not payload['passwords']:
+                result = ('empty', "No passwords found", None, 0)
+            else:
+                result = ('success', f"{payload['passwords']} passwords", writer.output_file, written)
+            self._finish(index, result)
+            # Only remember the new fingerprints once the changes are safely in a file
+            if self.delta_index is not None and self.results[index][0] != 'failed':
+                self.delta_index.update(cwclientid, payload['current'])
+
+        elif kind == 'error':
+            self._finish(index, ('failed', payload, None, 0))
+
+    def _finish(self, index, result):
+        """Close or discard a client's file and publish its result (errors fail the client, never the stage)"""
+        cwclientid, client_name, writer = self.tasks[index]
+        started = time.perf_counter()
+        try:
+            spool = self.spools.pop(index, None)
+            if spool is not None:
+                spool.close()
+            if result[0] != 'failed' and not self.shared_writer:
+                try:
+                    writer.close()
+                    if result[2] is not None:
+                        # Published under the next free name if the planned one was taken meanwhile
+                        result = result[:2] + (writer.output_file,) + result[3:]
+                except Exception as e:
+                    result = ('failed', f"Error saving: {str(e)}", None, 0)
+            if result[0] == 'failed' and not self.shared_writer and writer.handle is not None:
+                # A writer of its own is discarded; a shared (combined) writer is left as is
+                try:
+                    writer.discard()
+                except OSError:
+                    pass  # The client is reported as failed either way
+            if self.journal is not None:
+                try:
+                    self.journal.record(cwclientid, client_name, result[0], result[3], result[2], combined=self.shared_writer)
+                except OSError as e:
+                    result = ('failed', f"Could not update the export journal: {str(e)}", None, 0)
+            metrics = self.offboarding.metrics
+            metrics.add_client(cwclientid, 'write', time.perf_counter() - started)
+            metrics.set_client(cwclientid, name=client_name, status=result[0], rows=result[3])
+        except Exception as e:
+            result = ('failed', f"Error: {str(e)}", None, 0)
+        finally:
+            if result[0] == 'failed':
+                self.failed.add(index)
+            self.results[index] = result
+            self.done[index].set()
+
+def extract_token_from_performance_log(entries):
+    """
+    Find the authorization and clientid headers of a deploymentlogins request
+
+    Takes Chrome performance log entries and returns (bearer_token, clientid),
+    or (None, None) if no matching request is present. Entries that cannot be
+    the request are skipped with a substring test before any JSON parsing.
+    """
+    for entry in entries:
+        raw = entry.get('message', '')
+        if 'Network.requestWillBeSent' not in raw or 'deploymentlogins' not in raw.lower():
+            continue
+
+        try:
+            message = json.loads(raw)['message']
+            if message['method'] != 'Network.requestWillBeSent':
+                continue
+            request = message['params']['request']
+            if 'deploymentlogins' not in request['url'].lower():
+                continue
+        except (ValueError, KeyError, TypeError):
+            continue
+
+        bearer_token = None
+        clientid = None
+
+        # Extract authorization header (case-insensitive)
+        for key, value in request.get('headers', {}).items():
+            if key.lower() == 'authorization':
+                bearer_token = value
+            elif key.lower() == 'clientid':
+                clientid = value
+
+        if bearer_token and clientid:
+            return bearer_token, clientid
+
+    return None, None
+
+def get_cache_dir():
+    """
+    Per-user directory for the tool's caches (tokens, client lists)
+    """
+    if platform.system() == 'Windows':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        return Path(base) / 'CWA_Password_Extractor'
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'cwa_password_extractor'
+
+class TokenCache:
+    """
+    Encrypted on-disk cache of bearer tokens keyed by normalized base URL
+
+    Entries are encrypted with Fernet (AES + HMAC from the `cryptography`
+    package). The key comes from the CWA_TOKEN_CACHE_KEY environment variable
+    if set, otherwise from a key file readable only by the current user.
+    Without `cryptography` the cache is disabled rather than stored in plaintext.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, cache_dir=None, ttl=3600):
+        self.cache_dir = Path(cache_dir) if cache_dir else get_cache_dir()
+        self.cache_file = self.cache_dir / 'tokens.enc'
+        self.key_file = self.cache_dir / 'tokens.key'
+        self.ttl = ttl
+        self._fernet = None
+        self.available = True
+
+    def _get_fernet(self):
+        """Load (or create) the encryption key; None if encryption is unavailable"""
+        if self._fernet is not None or not self.available:
+            return self._fernet
+
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            print_warning("Token cache disabled - install 'cryptography' to enable it")
+            self.available = False
+            return None
+
+        passphrase = os.environ.get('CWA_TOKEN_CACHE_KEY')
+        if passphrase:
+            derived = hashlib.pbkdf2_hmac('sha256', passphrase.encode(), b'cwa-token-cache', 200000)
+            key = base64.urlsafe_b64encode(derived)
+        elif self.key_file.exists():
+            key = self.key_file.read_bytes().strip()
+        else:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            key = Fernet.generate_key()
+            # Create the key file with owner-only permissions
+            fd = os.open(str(self.key_file), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(key)
+
+        self._fernet = Fernet(key)
+        return self._fernet
+
+    def _load(self):
+        """Decrypt all entries (empty if missing, unreadable or encrypted with another key)"""
+        fernet = self._get_fernet()
+        if fernet is None or not self.cache_file.exists():
+            return {}
+        try:
+            return json.loads(fernet.decrypt(self.cache_file.read_bytes()))
+        except Exception:
+            return {}
+
+    def _save(self, entries):
+        """Encrypt and atomically replace the cache file"""
+        fernet = self._get_fernet()
+        if fernet is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        temp_file = self.cache_file.with_suffix('.tmp')
+        temp_file.write_bytes(fernet.encrypt(json.dumps(entries).encode()))
+        os.replace(temp_file, self.cache_file)
+
+    def get(self, base_url):
+        """Return the cached {'authorization', 'clientid', 'saved_at'} entry if not expired"""
+        with self._lock:
+            entry = self._load().get(base_url)
+        if entry and time.time() - entry.get('saved_at', 0) < self.ttl:
+            return entry
+        return None
+
+    def put(self, base_url, bearer_token, clientid):
+        """Store a token for base_url"""
+        with self._lock:
+            entries = self._load()
+            # Drop expired entries while we're here
+            entries = {url: e for url, e in entries.items() if time.time() - e.get('saved_at', 0) < self.ttl}
+            entries[base_url] = {'authorization': bearer_token, 'clientid': clientid, 'saved_at': time.time()}
+            self._save(entries)
+
+    def remove(self, base_url):
+        """Forget the token for base_url"""
+        with self._lock:
+            entries = self._load()
+            if entries.pop(base_url, None) is not None:
+                self._save(entries)
+
+    def clear(self):
+        """Delete every cached token"""
+        with self._lock:
+            if self.cache_file.exists():
+                self.cache_file.unlink()
+
+class ClientListCache:
+    """
+    On-disk cache of each server's client list (IDs and names only)
+
+    Lets the client menu appear immediately; the list is then refreshed in the
+    background. ETag/Last-Modified validators are kept for conditional requests.
+    """
+    def __init__(self, cache_dir=None, ttl=86400):
+        self.cache_dir = Path(cache_dir) if cache_dir else get_cache_dir()
+        self.ttl = ttl
+
+    def _path(self, base_url):
+        digest = hashlib.sha256(base_url.encode('utf-8')).hexdigest()[:16]
+        return self.cache_dir / f"clients_{digest}.json"
+
+    def load(self, base_url):
+        """Cached entry ({'clients', 'saved_at', 'etag', 'last_modified'}) or None"""
+        path = self._path(base_url)
+        if not path.exists():
+            return None
+        try:
+            entry = json.loads(path.read_text(encoding='utf-8'))
+        except ValueError:
+            return None
+        if entry.get('base_url') != base_url:
+            return None
+        entry['clients'] = [Client(client_id, name) for client_id, name in entry.get('clients', [])]
+        return entry
+
+    def is_fresh(self, entry):
+        """True if the entry is young enough to show before refreshing"""
+        return time.time() - entry.get('saved_at', 0) < self.ttl
+
+    def save(self, base_url, clients, validators=None):
+        """Store a freshly fetched client list"""
+        validators = validators or {}
+        entry = {
+            'base_url': base_url,
+            'saved_at': time.time(),
+            'etag': validators.get('etag'),
+            'last_modified': validators.get('last_modified'),
+            'clients': [[client.id, client.name] for client in clients],
+        }
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(base_url)
+        temp_file = path.with_suffix('.tmp')
+        temp_file.write_text(json.dumps(entry), encoding='utf-8')
+        os.replace(temp_file, path)
+
+    def touch(self, base_url, entry):
+        """Mark a cached list as confirmed current (server answered 304)"""
+        self.save(base_url, entry['clients'], entry)
+
+class AdaptiveRateController:
+    """AIMD limit on in-flight requests plus a token bucket, driven by 429/503s, errors and latency"""
+    DECREASE = 0.5  # Multiplicative decrease on throttling
+    THROTTLE_PAUSE = 1.0  # Seconds every request waits after a throttle without a Retry-After
+    LATENCY_DECREASE = 0.9  # Gentler decrease when only latency rose
+    LATENCY_TOLERANCE = 2.0  # Recent latency above this multiple of the long-run average is congestion
+    LATENCY_SLACK = 0.05  # ...if also at least this many seconds above it (ignores jitter on fast links)
+    RECENT_WEIGHT = 0.2  # EWMA weights of one request in the recent and long-run latency
+    BASELINE_WEIGHT = 0.02
+    MIN_RPS = 0.5
+    RATE_WINDOW = 5.0  # Seconds of completions used to measure the achieved rate
+    MAX_DECISIONS = 500
+
+    def __init__(self, max_concurrency, max_rps=None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_rps = max_rps
+        self.limit = float(self.max_concurrency)
+        self.rate = max_rps
+        self.tokens = 1.0
+        self.refilled = time.monotonic()
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.recent_latency = None
+        self.baseline_latency = None
+        self.last_decrease = 0.0
+        self.completions = deque()
+        self.condition = threading.Condition()
+
+        self.started = time.monotonic()
+        self.throttled = 0
+        self.increases = 0
+        self.decreases = 0
+        self.wait_s = 0.0
+        self.min_limit = self.max_concurrency
+        self.decisions = []
+
+    def acquire(self):
+        """Block until a request may be sent; returns the send time to pass to release()"""
+        waited_from = None
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if self.rate is not None:
+                    self.tokens = min(max(1.0, self.limit), self.tokens + (now - self.refilled) * self.rate)
+                self.refilled = now
+
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.in_flight >= int(self.limit):
+                    wait = 1.0  # Woken by release()
+                elif self.rate is not None and self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    if self.rate is not None:
+                        self.tokens -= 1
+                    self.in_flight += 1
+                    if waited_from is not None:
+                        self.wait_s += now - waited_from
+                    return now
+
+                if waited_from is None:
+                    waited_from = now
+                self.condition.wait(wait)
+
+    def release(self, sent, latency=None, status=None, retry_after=None):
+        """
+        Record how the request acquired at `sent` went: its latency and status (None for a connection error or timeout)
+
+        `retry_after` is the server's Retry-After in seconds, if it sent one.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+
+            if status is None or status in (429, 503):
+                if status is not None:
+                    self.throttled += 1
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                if sent >= self.last_decrease:
+                    achieved = self._achieved_rate(now)
+                    rate = max(self.MIN_RPS, (achieved or self.rate or self.limit) * self.DECREASE)
+                    if self.rate is None or rate < self.rate:
+                        self.rate = rate
+                        self.tokens = min(self.tokens, 1.0)
+                    self._decrease(now, self.DECREASE, f"HTTP {status}" if status else "connection error")
+                    if status is not None:
+                        self.paused_until = max(self.paused_until, now + (retry_after or self.THROTTLE_PAUSE))
+
+            elif latency is not None and status < 500:
+                self.completions.append(now)
+                if self.baseline_latency is None:
+                    self.recent_latency = self.baseline_latency = latency
+                self.recent_latency += (latency - self.recent_latency) * self.RECENT_WEIGHT
+                self.baseline_latency += (latency - self.baseline_latency) * self.BASELINE_WEIGHT
+
+                congested = self.recent_latency > max(self.baseline_latency * self.LATENCY_TOLERANCE,
+                                                      self.baseline_latency + self.LATENCY_SLACK)
+                if congested:
+                    if sent >= self.last_decrease and self.limit > 1:
+                        self._decrease(now, self.LATENCY_DECREASE, f"latency {self.recent_latency * 1000:.0f} ms")
+                else:
+                    before = int(self.limit)
+                    self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+                    if int(self.limit) > before:
+                        self.increases += 1
+                        self._decide(now, "increase")
+                    if self.rate is not None:
+                        self.rate = min(self.rate + 1 / self.rate, self.max_rps or float('inf'))
+
+            self.condition.notify_all()
+
+    def cancel(self):
+        """Give back a slot without recording an outcome (the request was abandoned)"""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def _decrease(self, now, factor, reason):
+        self.limit = max(1.0, self.limit * factor)
+        self.min_limit = min(self.min_limit, int(self.limit))
+        self.last_decrease = now
+        self.decreases += 1
+        self._decide(now, reason)
+
+    def _achieved_rate(self, now):
+        """Completed requests per second over the last RATE_WINDOW seconds (None until there are some)"""
+        while self.completions and now - self.completions[0] > self.RATE_WINDOW:
+            self.completions.popleft()
+        if len(self.completions) < 2:
+            return None
+        return len(self.completions) / max(now - self.completions[0], 1e-3)
+
+    def _decide(self, now, reason):
+        if len(self.decisions) < self.MAX_DECISIONS:
+            self.decisions.append({
+                't_s': round(now - self.started, 3), 'reason': reason, 'limit': int(self.limit),
+                'rps': round(self.rate, 2) if self.rate is not None else None,
+            })
+
+    def to_dict(self):
+        """JSON-ready summary and decision log"""
+        with self.condition:
+            return {
+                'max_concurrency': self.max_concurrency, 'max_rps': self.max_rps,
+                'limit': int(self.limit), 'min_limit': self.min_limit,
+                'rps': round(self.rate, 2) if self.rate is not None else None,
+                'throttled': self.throttled, 'increases': self.increases, 'decreases': self.decreases,
+                'wait_s': round(self.wait_s, 4), 'decisions': list(self.decisions),
+            }
+
 class CWAOffboarding:
-    def __init__(self, base_url=None, output_dir=None):
+    def __init__(self, base_url=None, output_dir=None, pool_size=10, timeout=30, max_retries=3, backoff_factor=1.0, max_backoff=60, page_size=1000,
+                 rate_control=True, max_rps=None):
         # Normalize base URL - remove any /Automate or /automate suffix
         if base_url:
             base_url = base_url.rstrip('/')
@@ -159,6 +1903,11 @@ class CWAOffboarding:
         self.bearer_token = None
         self.clientid = None
         self.headers = None
+        self.search_index = None
+
+        # Background client list refresh (see get_all_clients)
+        self._client_refresh = None
+        self._refreshed_clients = None
 
         # Set output directory (default to current working directory)
         if output_dir:
@@ -170,14 +1919,307 @@ class CWAOffboarding:
         # Create output directory if it doesn't exist
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
-    def get_credentials_automated(self):
+        # HTTP settings shared by every API call
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.page_size = page_size
+        # A short page only ends paging once a full page proved the server honours this size
+        self._confirmed_page_size = None
+        self._page_size_lock = threading.Lock()
+        self.session = self._create_session()
+
+        # Re-authentication: api_get calls credential_refresher (if set) on a 401.
+        # While a refresh runs _auth_ready is cleared, pausing all other requests.
+        self.credential_refresher = None
+        self._auth_ready = threading.Event()
+        self._auth_ready.set()
+        self._auth_lock = threading.Lock()
+        self._auth_generation = 0
+        self._auth_failed = False
+        self._refreshing_thread = None
+
+        # Request and export statistics (see get_request_stats and --metrics-file)
+        self.metrics = RunMetrics(self.base_url)
+
+        # Paces api_get to what the server tolerates (see AdaptiveRateController)
+        self.rate_controller = None
+        if rate_control:
+            self.rate_controller = AdaptiveRateController(self.pool_size, max_rps)
+            self.metrics.rate_controller = self.rate_controller
+
+        # Counts from the most recent export_passwords() call (used by batch mode)
+        self.last_summary = None
+
+    def _create_session(self):
+        """
+        Create a keep-alive session with a connection pool sized for the export workers
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # Retries are handled in api_get so they can honor Retry-After and be counted
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _retry_delay(self, attempt, response=None):
+        """
+        Seconds to wait before the next attempt (Retry-After if sent, else exponential backoff)
+        """
+        delay = self.backoff_factor * (2 ** attempt)
+
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    # Retry-After may also be an HTTP date
+                    retry_at = parsedate_to_datetime(retry_after)
+                    delay = (retry_at - datetime.now(retry_at.tzinfo)).total_seconds()
+                except (TypeError, ValueError):
+                    pass
+
+        return min(max(delay, 0), self.max_backoff)
+
+    def api_get(self, url, extra_headers=None, stream=False):
+        """
+        GET an Automate API URL over the shared session
+
+        Connection errors, timeouts and 429/5xx responses are retried up to
+        max_retries times with exponential backoff. A 401 triggers one
+        credential refresh (see _refresh_after_401) and a retry with the new
+        token. The last response is returned as-is, so callers still check
+        the status code. With `stream`, a 200/201 body is left unread for the
+        caller (who counts its bytes) and the latency is time to headers.
+        Requests go through the rate controller, if there is one.
+        """
+        import requests
+
+        attempt = 0
+        reauthenticated = False
+        while True:
+            # Wait here while another worker is refreshing the token
+            # (the refresher's own validation requests go straight through)
+            if threading.get_ident() != self._refreshing_thread:
+                self._auth_ready.wait()
+            generation = self._auth_generation
+
+            controller = self.rate_controller
+            if controller:
+                sent = controller.acquire()
+            started = time.perf_counter()
+            try:
+                headers = {**(self.headers or {}), **extra_headers} if extra_headers else self.headers
+                response = self.session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                if controller:
+                    controller.release(sent)
+                self.metrics.record_request(time.perf_counter() - started, error=True)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+            except BaseException:
+                if controller:
+                    controller.cancel()
+                raise
+            else:
+                if controller:
+                    retry_after = None
+                    if response.headers.get('Retry-After'):
+                        retry_after = self._retry_delay(0, response)
+                    controller.release(sent, time.perf_counter() - started, response.status_code, retry_after)
+                streamed = stream and response.status_code in (200, 201)
+                self.metrics.record_request(time.perf_counter() - started, 0 if streamed else len(response.content))
+                if response.status_code == 401 and not reauthenticated and self._refresh_after_401(generation):
+                    reauthenticated = True
+                    continue
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_delay(attempt, response)
+
+            attempt += 1
+            self.metrics.record_retry()
+            time.sleep(delay)
+
+    def iter_pages(self, path, conditional_headers=None, validators=None, transfer=None):
+        """
+        Yield the rows of an Automate list endpoint in lists of up to STREAM_BATCH_ROWS
+
+        Walks page/pageSize so large result sets arrive in pieces instead of one
+        huge response. A page_size of -1 requests everything in a single call.
+        Until a full page shows the server honours page_size, a short page is
+        followed by one more request: rows there mean the server caps the page
+        size, and its cap becomes the page size for the rest of the run.
+        Each page is decoded while it streams in (iter_json_array), so even an
+        unpaged response never sits in memory whole.
+        Raises APIError if any page does not come back with a 200/201 (so a 304
+        answer to `conditional_headers` is an APIError with status_code 304).
+        Validators only describe the response they came with, so
+        `conditional_headers` are sent, and the ETag and Last-Modified stored
+        in the `validators` dict, only for an unpaged request: a 304 for one
+        page says nothing about the others. The bytes and pages received are
+        added to transfer['bytes'] and transfer['pages'] if `transfer` is given.
+        """
+        separator = '&' if '?' in path else '?'
+        page = 1
+        page_size = self.page_size
+        short_page = None  # Length of a short page not yet known to be the last one
+
+        while True:
+            if page_size > 0:
+                url = f"{self.base_url}{path}{separator}page={page}&pageSize={page_size}"
+            else:
+                url = f"{self.base_url}{path}{separator}pageSize=-1"
+
+            response = self.api_get(url, conditional_headers if page_size <= 0 else None, stream=True)
+            try:
+                if response.status_code not in [200, 201]:
+                    raise APIError(response)
+
+                if page_size <= 0 and validators is not None:
+                    validators['etag'] = response.headers.get('ETag')
+                    validators['last_modified'] = response.headers.get('Last-Modified')
+                if transfer is not None:
+                    transfer['pages'] = transfer.get('pages', 0) + 1
+
+                count = 0
+                rows = []
+                for row in iter_json_array(self._read_body(response, transfer)):
+                    rows.append(row)
+                    if len(rows) == STREAM_BATCH_ROWS:
+                        count += len(rows)
+                        yield rows
+                        rows = []
+                count += len(rows)
+                if rows:
+                    yield rows
+            finally:
+                # Returns a fully read connection to the pool, drops an abandoned one
+                response.close()
+
+            # Unpaged, past the end, or paging ignored
+            if page_size <= 0 or count == 0 or count > page_size:
+                return
+            if short_page is not None:
+                # More rows after a short page: the server caps the page size there
+                page_size = self._learn_page_cap(short_page)
+                short_page = None
+            if count == page_size:
+                self._confirmed_page_size = page_size
+            elif self._confirmed_page_size == page_size:
+                return
+            else:
+                short_page = count
+            page += 1
+
+    def _learn_page_cap(self, cap):
+        """Use the server's page size cap from now on; returns it"""
+        with self._page_size_lock:
+            if self.page_size > cap:
+                print_warning(f"The server returns at most {cap} rows per page - continuing with --page-size {cap}")
+                self.page_size = cap
+            self._confirmed_page_size = cap
+            return cap
+
+    def _read_body(self, response, transfer=None):
+        """Yield a streamed response body in chunks, counting the bytes received"""
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            self.metrics.record_bytes(len(chunk))
+            if transfer is not None:
+                transfer['bytes'] = transfer.get('bytes', 0) + len(chunk)
+            yield chunk
+
+    def _refresh_after_401(self, seen_generation):
+        """
+        Refresh credentials once for every worker that hit the same expired token
+
+        The first worker to get a 401 pauses the others and calls
+        credential_refresher; workers whose 401 came from the old token just
+        reuse the new one. Returns True if the request should be retried.
+        """
+        if self.credential_refresher is None or threading.get_ident() == self._refreshing_thread:
+            return False
+
+        with self._auth_lock:
+            if self._auth_generation != seen_generation:
+                # Someone else already refreshed since this request was sent
+                return True
+            if self._auth_failed:
+                return False
+
+            self._auth_ready.clear()
+            self._refreshing_thread = threading.get_ident()
+            try:
+                print_warning("Bearer token expired - pausing export to re-authenticate...")
+                refreshed = False
+                try:
+                    refreshed = self.credential_refresher()
+                except Exception as e:
+                    print_error(f"Re-authentication failed: {str(e)}")
+
+                if refreshed:
+                    self._auth_generation += 1
+                    self.metrics.record_refresh()
+                    print_success("Re-authenticated - resuming export")
+                else:
+                    # Don't retry the refresh for every remaining client
+                    self._auth_failed = True
+                    print_error("Could not re-authenticate - remaining clients will fail with 401")
+                return refreshed
+            finally:
+                self._refreshing_thread = None
+                self._auth_ready.set()
+
+    def get_request_stats(self):
+        """
+        Summarize API request count, retries, errors, bytes and latency percentiles (in seconds)
+        """
+        return self.metrics.request_stats()
+
+    def _wait_for_token(self, driver, timeout, poll_interval=0.1):
+        """
+        Poll the browser's performance log until a deploymentlogins request shows up
+
+        Returns (bearer_token, clientid) as soon as the request is seen, or
+        (None, None) once `timeout` seconds have passed.
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            # get_log drains the buffer, so each poll only scans new events
+            bearer_token, clientid = extract_token_from_performance_log(driver.get_log('performance'))
+            if bearer_token and clientid:
+                return bearer_token, clientid
+            if time.monotonic() >= deadline:
+                return None, None
+            time.sleep(poll_interval)
+
+    def get_credentials_automated(self, token_timeout=15, headless=False, profile_dir=None):
         """
         Open browser for manual login and extract bearer token using Selenium
+
+        After login, token capture gives up after `token_timeout` seconds.
+        With `profile_dir` the Chrome profile (and its login session) is kept
+        between runs. `headless` runs without a window or prompts and only
+        succeeds if that saved session is still logged in.
         """
-        print_section("Automated Bearer Token Extraction")
-        print_info("This will open a browser window for you to log in manually.")
-        print_info("After logging in, the tool will automatically extract your bearer token.")
-        input(f"\n{Colors.BOLD}Press Enter to continue...{Colors.RESET}")
+        if headless:
+            print_info("Refreshing bearer token with headless Chrome...")
+        else:
+            print_section("Automated Bearer Token Extraction")
+            print_info("This will open a browser window for you to log in manually.")
+            print_info("After logging in, the tool will automatically extract your bearer token.")
+            input(f"\n{Colors.BOLD}Press Enter to continue...{Colors.RESET}")
+
+        from selenium import webdriver
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.chrome.options import Options
 
         # Setup Chrome options
         chrome_options = Options()
@@ -188,8 +2230,16 @@ class CWAOffboarding:
         # Enable performance logging to capture network requests
         chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
 
-        print_info("Opening browser...")
-        print_info("Selenium will automatically download ChromeDriver if needed...")
+        if profile_dir:
+            # Persist cookies so a later (headless) refresh can skip the login
+            Path(profile_dir).mkdir(parents=True, exist_ok=True)
+            chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+        if headless:
+            chrome_options.add_argument("--headless=new")
+
+        if not headless:
+            print_info("Opening browser...")
+            print_info("Selenium will automatically download ChromeDriver if needed...")
 
         # Selenium 4.6+ automatically manages ChromeDriver
         # No need for webdriver-manager!
@@ -206,20 +2256,24 @@ class CWAOffboarding:
             login_url = f"{self.base_url}/Automate"
             print_info(f"Navigating to {login_url}...")
 
-            print(f"\n{Colors.BOLD}{Colors.CYAN}{'='*80}{Colors.RESET}")
-            print(f"{Colors.BOLD}{Colors.CYAN}PLEASE LOG IN TO CONNECTWISE AUTOMATE IN THE BROWSER WINDOW{Colors.RESET}")
-            print(f"{Colors.BOLD}{Colors.CYAN}{'='*80}{Colors.RESET}")
-            print(f"\n{Colors.YELLOW}Instructions:{Colors.RESET}")
-            print(f"{Colors.WHITE}1. Complete the login process (including MFA if prompted){Colors.RESET}")
-            print(f"{Colors.WHITE}2. The tool will automatically detect when you're logged in{Colors.RESET}")
-            print(f"{Colors.BOLD}{Colors.CYAN}{'='*80}{Colors.RESET}\n")
+            if not headless:
+                print(f"\n{Colors.BOLD}{Colors.CYAN}{'='*80}{Colors.RESET}")
+                print(f"{Colors.BOLD}{Colors.CYAN}PLEASE LOG IN TO CONNECTWISE AUTOMATE IN THE BROWSER WINDOW{Colors.RESET}")
+                print(f"{Colors.BOLD}{Colors.CYAN}{'='*80}{Colors.RESET}")
+                print(f"\n{Colors.YELLOW}Instructions:{Colors.RESET}")
+                print(f"{Colors.WHITE}1. Complete the login process (including MFA if prompted){Colors.RESET}")
+                print(f"{Colors.WHITE}2. The tool will automatically detect when you're logged in{Colors.RESET}")
+                print(f"{Colors.BOLD}{Colors.CYAN}{'='*80}{Colors.RESET}\n")
 
             driver.get(login_url)
             initial_url = driver.current_url
+            # A saved profile session may land straight on a post-login page
+            already_logged_in = '/automate/browse/companies' in initial_url.lower() or '/dashboard' in initial_url.lower()
 
             # Wait for user to log in by monitoring URL changes
-            print_warning("Waiting for you to log in...")
-            wait = WebDriverWait(driver, 300)  # 5 minute timeout for login
+            if not headless:
+                print_warning("Waiting for you to log in...")
+            wait = WebDriverWait(driver, 30 if headless else 300)  # 5 minute timeout for login
 
             try:
                 # More specific check: wait for URL to change AND contain browse/companies
@@ -227,7 +2281,7 @@ class CWAOffboarding:
                 def check_logged_in(driver):
                     current_url = driver.current_url.lower()
                     # Must have changed from login URL AND contain a known post-login path
-                    url_changed = current_url != initial_url.lower()
+                    url_changed = current_url != initial_url.lower() or already_logged_in
                     has_browse = '/automate/browse/companies' in current_url
                     has_dashboard = '/dashboard' in current_url
 
@@ -239,104 +2293,39 @@ class CWAOffboarding:
                 wait.until(check_logged_in)
 
                 print_success("Login detected!")
-                time.sleep(2)  # Brief pause to ensure session is established
 
             except Exception as e:
+                if headless:
+                    # Nobody can log in to a headless browser
+                    print_warning("Saved browser session is no longer logged in")
+                    return False
                 print_warning(f"Timeout waiting for login. Current URL: {driver.current_url}")
                 print_warning("Proceeding anyway...")
 
-            # Clear any existing logs
-            driver.get_log('performance')
-
-            # Navigate to the computers page first
-            print_info("Navigating to company computers page...")
-            computers_url = f"{self.base_url}/automate/browse/companies/computers"
-            driver.get(computers_url)
-            time.sleep(3)
-
-            # Now navigate to a company passwords page to trigger the API call
-            print_info("Navigating to company passwords page to capture bearer token...")
-            print_info("Trying company ID 377...")
-
-            test_company_url = f"{self.base_url}/automate/browse/companies/company-passwords?companyId=377"
-            driver.get(test_company_url)
-
-            # Wait for page to load and API calls to be made
-            print_warning("Waiting for API calls to be captured...")
-            time.sleep(5)
-
-            # Extract bearer token from performance logs
-            print_info("Extracting bearer token from network requests...")
-            logs = driver.get_log('performance')
-
-            bearer_token = None
-            clientid = None
-
-            for log in logs:
-                try:
-                    log_data = json.loads(log['message'])
-                    message = log_data['message']
-
-                    # Look for network request events
-                    if message['method'] == 'Network.requestWillBeSent':
-                        request = message['params']['request']
+            # The post-login page may already have called deploymentlogins
+            bearer_token, clientid = extract_token_from_performance_log(driver.get_log('performance'))
 
-                        # Check if it's a deploymentlogins API call
-                        if 'deploymentlogins' in request['url'].lower():
-                            headers = request.get('headers', {})
-
-                            # Extract authorization header (case-insensitive)
-                            for key, value in headers.items():
-                                if key.lower() == 'authorization':
-                                    bearer_token = value
-                                elif key.lower() == 'clientid':
-                                    clientid = value
-
-                            if bearer_token and clientid:
-                                break
-
-                except Exception as e:
-                    continue
-
-            # If not found with company 377, try a few more companies
             if not bearer_token or not clientid:
-                print_warning("Bearer token not found with company 377. Trying other companies...")
+                # Navigate to the computers page first
+                print_info("Navigating to company computers page...")
+                computers_url = f"{self.base_url}/automate/browse/companies/computers"
+                driver.get(computers_url)
+
+                # Now open company passwords pages until one triggers the API call,
+                # returning as soon as the request appears in the network log
+                print_info("Navigating to company passwords page to capture bearer token...")
+                deadline = time.monotonic() + token_timeout
+
+                for company_id in [377, 1, 100, 438, 500]:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
 
-                for company_id in [1, 100, 438, 500]:
                     print_info(f"Trying company ID {company_id}...")
-
-                    # Clear logs
-                    driver.get_log('performance')
-
                     test_url = f"{self.base_url}/automate/browse/companies/company-passwords?companyId={company_id}"
                     driver.get(test_url)
-                    time.sleep(3)
-
-                    logs = driver.get_log('performance')
-
-                    for log in logs:
-                        try:
-                            log_data = json.loads(log['message'])
-                            message = log_data['message']
-
-                            if message['method'] == 'Network.requestWillBeSent':
-                                request = message['params']['request']
-
-                                if 'deploymentlogins' in request['url'].lower():
-                                    headers = request.get('headers', {})
-
-                                    for key, value in headers.items():
-                                        if key.lower() == 'authorization':
-                                            bearer_token = value
-                                        elif key.lower() == 'clientid':
-                                            clientid = value
-
-                                    if bearer_token and clientid:
-                                        break
-
-                        except Exception as e:
-                            continue
 
+                    bearer_token, clientid = self._wait_for_token(driver, min(remaining, 5))
                     if bearer_token and clientid:
                         break
 
@@ -348,13 +2337,7 @@ class CWAOffboarding:
                 print(f"{Colors.CYAN}Client ID: {Colors.WHITE}{clientid}{Colors.RESET}")
                 print(f"{Colors.BOLD}{Colors.GREEN}{'='*80}{Colors.RESET}")
 
-                self.bearer_token = bearer_token
-                self.clientid = clientid
-                self.headers = {
-                    "authorization": bearer_token,
-                    "clientid": clientid,
-                    "accept": "application/json"
-                }
+                self.set_credentials(bearer_token, clientid)
 
                 return True
             else:
@@ -384,54 +2367,279 @@ class CWAOffboarding:
         Manual method for getting credentials
         """
         print_section("Manual Bearer Token Entry")
-        self.clientid = input(f"{Colors.CYAN}Enter your Client ID: {Colors.RESET}")
-        self.bearer_token = input(f"{Colors.CYAN}Enter your Bearer Token (e.g., 'bearer abc123...'): {Colors.RESET}")
+        clientid = input(f"{Colors.CYAN}Enter your Client ID: {Colors.RESET}")
+        bearer_token = input(f"{Colors.CYAN}Enter your Bearer Token (e.g., 'bearer abc123...'): {Colors.RESET}")
+
+        self.set_credentials(bearer_token, clientid)
 
+        return True
+
+    def refresh_credentials(self, token_cache=None, profile_dir=None, interactive=True, use_browser=True):
+        """
+        Obtain a new bearer token after the current one expired
+
+        Tries, in order: a newer token in the cache (e.g. from another run),
+        headless Chrome reusing the saved browser profile, and finally - if
+        `interactive` - a visible browser login or manual entry.
+        """
+        if token_cache:
+            entry = token_cache.get(self.base_url)
+            if entry and entry['authorization'] != self.bearer_token:
+                self.set_credentials(entry['authorization'], entry['clientid'])
+                if self.validate_credentials():
+                    print_success("Picked up a newer cached bearer token")
+                    return True
+
+        refreshed = False
+        if use_browser and profile_dir:
+            try:
+                refreshed = self.get_credentials_automated(headless=True, profile_dir=profile_dir)
+            except Exception as e:
+                print_warning(f"Headless refresh failed: {str(e)}")
+
+        if not refreshed and interactive:
+            if use_browser:
+                try:
+                    refreshed = self.get_credentials_automated(profile_dir=profile_dir)
+                except Exception:
+                    refreshed = False
+            if not refreshed:
+                refreshed = self.get_credentials_manual()
+
+        if refreshed and token_cache:
+            token_cache.put(self.base_url, self.bearer_token, self.clientid)
+        return refreshed
+
+    def set_credentials(self, bearer_token, clientid):
+        """
+        Use the given bearer token and client ID for all API calls
+        """
+        self.bearer_token = bearer_token
+        self.clientid = clientid
         self.headers = {
-            "authorization": self.bearer_token,
-            "clientid": self.clientid,
+            "authorization": bearer_token,
+            "clientid": clientid,
             "accept": "application/json"
         }
 
-        return True
+    def validate_credentials(self):
+        """
+        Cheap API probe (one client, one field) to check the current token still works
+
+        Returns True if it does, False only if the server rejects it (401/403),
+        and None if the server could not be asked (network error, outage).
+        """
+        import requests
+
+        try:
+            response = self.api_get(f"{self.base_url}{CLIENTS_PATH}&page=1&pageSize=1")
+        except requests.RequestException:
+            return None
+        if response.status_code == 200:
+            return True
+        if response.status_code in (401, 403):
+            return False
+        return None
+
+    def load_cached_credentials(self, token_cache):
+        """
+        Reuse a cached token for this base URL if it has not expired and still works
+
+        A cached token the server rejects is removed from the cache; one that
+        can't be checked because the server is unreachable is kept and used.
+        """
+        entry = token_cache.get(self.base_url)
+        if not entry:
+            return False
+
+        print_info("Found a cached bearer token, checking it is still valid...")
+        self.set_credentials(entry['authorization'], entry['clientid'])
+
+        valid = self.validate_credentials()
+        if valid:
+            print_success("Using cached bearer token")
+            return True
+        if valid is None:
+            print_warning("Could not reach the server to check the cached bearer token - using it anyway")
+            return True
+
+        print_warning("Cached bearer token was rejected - logging in again")
+        token_cache.remove(self.base_url)
+        self.bearer_token = None
+        self.clientid = None
+        self.headers = None
+        return False
+
+    def _fetch_clients(self, client_cache=None, cached=None):
+        """
+        Download the client list, reusing `cached` if the server says it is unchanged
+
+        Only an unpaged download (--page-size -1) can be answered with a 304;
+        a paged one always downloads every page.
+        """
+        conditional_headers = {}
+        if cached and cached.get('etag'):
+            conditional_headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            conditional_headers['If-Modified-Since'] = cached['last_modified']
+
+        validators = {}
+        clients = []
+        try:
+            for rows in self.iter_pages(CLIENTS_PATH, conditional_headers or None, validators):
+                clients.extend(Client(row.get('Id'), row.get('Name') or '') for row in rows)
+        except APIError as e:
+            if e.status_code == 304 and cached:
+                client_cache.touch(self.base_url, cached)
+                return cached['clients']
+            raise
+
+        if client_cache:
+            client_cache.save(self.base_url, clients, validators)
+        return clients
+
+    def _refresh_clients_in_background(self, client_cache, cached):
+        """Start a thread that re-downloads the client list while the user browses"""
+        def refresh():
+            try:
+                self._refreshed_clients = self._fetch_clients(client_cache, cached)
+            except Exception:
+                pass  # Keep using the cached list
+
+        self._client_refresh = threading.Thread(target=refresh, daemon=True)
+        self._client_refresh.start()
 
-    def get_all_clients(self):
+    def poll_refreshed_clients(self, current_clients):
+        """
+        Return the background-refreshed client list if it differs from `current_clients`
+
+        Returns None while the refresh is still running, when it failed, or
+        when nothing changed. Each refresh result is returned once.
+        """
+        if self._client_refresh is None or self._client_refresh.is_alive():
+            return None
+
+        clients, self._refreshed_clients = self._refreshed_clients, None
+        self._client_refresh = None
+        if clients is None:
+            return None
+        if [(c.id, c.name) for c in clients] == [(c.id, c.name) for c in current_clients]:
+            return None
+
+        self.search_index = ClientSearchIndex(clients)
+        return clients
+
+    def _fetch_client_batch(self, client_ids):
+        """Rows for a batch of client IDs from one condition-filtered client query"""
+        condition = quote(f"Id in ({','.join(str(client_id) for client_id in client_ids)})")
+        rows = []
+        for page in self.iter_pages(CLIENTS_BY_CONDITION_PATH.format(condition=condition)):
+            rows.extend(page)
+        return rows
+
+    def _fetch_client(self, client_id):
+        """Row for a single client ID, or None if it does not exist"""
+        response = self.api_get(f"{self.base_url}{CLIENT_PATH.format(cwclientid=client_id)}")
+        if response.status_code == 404:
+            return None
+        if response.status_code not in [200, 201]:
+            raise APIError(response)
+        return response.json()
+
+    def get_clients_by_id(self, client_ids, workers=4):
+        """
+        Look up just the given client IDs instead of downloading the whole client list
+
+        IDs go out in batches of CLIENT_ID_BATCH as condition=Id in (...)
+        queries, up to `workers` at once; if the server rejects the condition,
+        every ID is fetched from /clients/{id} instead. Returns Clients in the
+        order requested (unknown IDs are reported and left out), or None if
+        the lookup failed.
+        """
+        print_info(f"Looking up {len(client_ids)} client(s) by ID...")
+        batches = [client_ids[i:i + CLIENT_ID_BATCH] for i in range(0, len(client_ids), CLIENT_ID_BATCH)]
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(client_ids)))) as executor:
+                try:
+                    rows = [row for batch in executor.map(self._fetch_client_batch, batches) for row in batch]
+                except APIError as e:
+                    if e.status_code not in (400, 422):
+                        raise
+                    rows = [row for row in executor.map(self._fetch_client, client_ids) if row]
+
+        except APIError as e:
+            print_error(f"Failed to look up clients. Status code: {e.status_code}")
+            print(f"{Colors.RED}Response: {e.response.text}{Colors.RESET}")
+            return None
+
+        except Exception as e:
+            print_error(f"Error looking up clients: {str(e)}")
+            return None
+
+        found = {}
+        for row in rows:
+            client = Client(row.get('Id'), row.get('Name') or '')
+            found[int(client.id)] = client
+
+        missing = [client_id for client_id in client_ids if client_id not in found]
+        if missing:
+            print_warning(f"Client ID(s) not found: {', '.join(str(client_id) for client_id in missing)}")
+
+        clients = [found[client_id] for client_id in client_ids if client_id in found]
+        print_success(f"Found {len(clients)} of {len(client_ids)} client(s)")
+        return clients
+
+    def get_all_clients(self, client_cache=None):
         """
         Retrieve all clients from CWA
+
+        With a `client_cache`, a recent cached list is returned straight away and
+        refreshed in the background (pick it up with poll_refreshed_clients).
+        An old or missing cache entry is refreshed before returning.
         """
+        cached = client_cache.load(self.base_url) if client_cache else None
+
+        if cached and client_cache.is_fresh(cached):
+            clients = cached['clients']
+            self.search_index = ClientSearchIndex(clients)
+            age_minutes = (time.time() - cached['saved_at']) / 60
+            print_success(f"Loaded {len(clients)} clients from cache ({age_minutes:.0f} min old) - refreshing in the background")
+            self._refresh_clients_in_background(client_cache, cached)
+            return clients
+
         print_info("Fetching client list...")
-        clientsurl = f"{self.base_url}/cwa/api/v1/clients?pageSize=-1&includeFields=Name&orderBy=Name%20asc"
 
         try:
-            response = requests.get(clientsurl, headers=self.headers)
-
-            if response.status_code == 200:
-                clients_df = pd.DataFrame(response.json())
-                print_success(f"Found {len(clients_df)} clients")
-                return clients_df
-            else:
-                print_error(f"Failed to fetch clients. Status code: {response.status_code}")
-                print(f"{Colors.RED}Response: {response.text}{Colors.RESET}")
-                return None
+            clients = self._fetch_clients(client_cache, cached)
+            self.search_index = ClientSearchIndex(clients)
+            print_success(f"Found {len(clients)} clients")
+            return clients
+
+        except APIError as e:
+            print_error(f"Failed to fetch clients. Status code: {e.status_code}")
+            print(f"{Colors.RED}Response: {e.response.text}{Colors.RESET}")
+            return None
 
         except Exception as e:
             print_error(f"Error fetching clients: {str(e)}")
             return None
 
-    def search_clients(self, clients_df, search_term):
+    def search_clients(self, clients, search_term, index=None):
         """
-        Search clients by name
+        Search clients by name (typo tolerant) or ID, best matches first
         """
         if search_term:
-            filtered = clients_df[clients_df['Name'].str.contains(search_term, case=False, na=False)]
-            return filtered
-        return clients_df
+            if index is None or index.clients is not clients:
+                index = ClientSearchIndex(clients)
+            return index.search(search_term)
+        return clients
 
-    def display_clients(self, clients_df, page=0, page_size=60):
+    def display_clients(self, clients, page=0, page_size=60):
         """
         Display clients in a 3-column paginated format
         """
-        total = len(clients_df)
+        total = len(clients)
         start = page * page_size
         end = min(start + page_size, total)
 
@@ -440,7 +2648,7 @@ class CWAOffboarding:
         print(f"{Colors.BOLD}{Colors.MAGENTA}{'='*100}{Colors.RESET}\n")
 
         # Display in 3 columns
-        clients_to_display = clients_df.iloc[start:end]
+        clients_to_display = clients[start:end]
         rows_per_column = (len(clients_to_display) + 2) // 3  # Round up division
 
         for row_idx in range(rows_per_column):
@@ -450,10 +2658,8 @@ class CWAOffboarding:
                 actual_idx = row_idx + (col_idx * rows_per_column)
 
                 if actual_idx < len(clients_to_display):
-                    original_idx = clients_to_display.index[actual_idx]
-                    row = clients_to_display.loc[original_idx]
                     display_idx = start + actual_idx + 1
-                    client_name = row['Name'][:28]  # Truncate for column width
+                    client_name = clients_to_display[actual_idx].name[:28]  # Truncate for column width
 
                     # Format: "123  Company Name"
                     columns.append(f"{Colors.WHITE}{display_idx:<4}{Colors.RESET} {Colors.GREEN}{client_name:<28}{Colors.RESET}")
@@ -466,26 +2672,38 @@ class CWAOffboarding:
 
         return start, end, total
 
-    def select_clients_interactive(self, clients_df):
+    def select_clients_interactive(self, clients):
         """
         Interactive client selection with search
         """
         print_section("Client Selection")
         print(f"{Colors.CYAN}Options:{Colors.RESET}")
-        print(f"  {Colors.YELLOW}•{Colors.RESET} Enter {Colors.BOLD}'search'{Colors.RESET} to filter clients")
+        print(f"  {Colors.YELLOW}•{Colors.RESET} Enter {Colors.BOLD}'search'{Colors.RESET} to filter clients by name or ID (typos are OK)")
         print(f"  {Colors.YELLOW}•{Colors.RESET} Enter client number(s) separated by commas (e.g., {Colors.BOLD}1,3,5{Colors.RESET})")
         print(f"  {Colors.YELLOW}•{Colors.RESET} Enter a range (e.g., {Colors.BOLD}1-5{Colors.RESET})")
         print(f"  {Colors.YELLOW}•{Colors.RESET} Enter {Colors.BOLD}'all'{Colors.RESET} to select all clients")
         print(f"  {Colors.YELLOW}•{Colors.RESET} Enter {Colors.BOLD}'list'{Colors.RESET} to show more clients")
         print(f"  {Colors.YELLOW}•{Colors.RESET} Enter {Colors.BOLD}'quit'{Colors.RESET} to exit")
 
-        filtered_df = clients_df.copy()
+        filtered = list(clients)
+        search_term = ""
+        index = self.search_index
+        if index is None or index.clients is not clients:
+            index = ClientSearchIndex(clients)
         page = 0
         page_size = 60  # Match the display page size (3 columns x 20 rows)
         selected_indices = []
 
         while True:
-            self.display_clients(filtered_df, page, page_size)
+            # Swap in the background-refreshed client list once it arrives
+            refreshed = self.poll_refreshed_clients(clients)
+            if refreshed is not None:
+                clients = refreshed
+                index = self.search_index
+                filtered = self.search_clients(clients, search_term, index)
+                print_info(f"Client list updated from the server ({len(clients)} clients)")
+
+            self.display_clients(filtered, page, page_size)
 
             choice = input(f"\n{Colors.BOLD}{Colors.CYAN}Your choice: {Colors.RESET}").strip().lower()
 
@@ -494,18 +2712,18 @@ class CWAOffboarding:
 
             elif choice == 'search':
                 search_term = input(f"{Colors.CYAN}Enter search term: {Colors.RESET}").strip()
-                filtered_df = self.search_clients(clients_df, search_term)
+                filtered = self.search_clients(clients, search_term, index)
                 page = 0
-                print_success(f"Found {len(filtered_df)} matching clients")
+                print_success(f"Found {len(filtered)} matching clients")
 
             elif choice == 'list':
                 page += 1
-                if page * page_size >= len(filtered_df):
+                if page * page_size >= len(filtered):
                     print_warning("No more clients to display")
                     page = 0
 
             elif choice == 'all':
-                return filtered_df
+                return filtered
 
             else:
                 # Parse selection
@@ -524,11 +2742,11 @@ class CWAOffboarding:
                         selected_indices = [int(p.strip()) - 1 for p in parts if p.strip().isdigit()]
 
                     if selected_indices:
-                        selected_clients = filtered_df.iloc[selected_indices]
+                        selected_clients = [filtered[i] for i in selected_indices]
 
                         print(f"\n{Colors.CYAN}You selected {len(selected_clients)} client(s):{Colors.RESET}")
-                        for _, row in selected_clients.iterrows():
-                            print(f"  {Colors.GREEN}•{Colors.RESET} {Colors.WHITE}{row['Name']}{Colors.RESET}")
+                        for client in selected_clients:
+                            print(f"  {Colors.GREEN}•{Colors.RESET} {Colors.WHITE}{client.name}{Colors.RESET}")
 
                         confirm = input(f"\n{Colors.BOLD}{Colors.YELLOW}Proceed with these clients? (y/n): {Colors.RESET}").strip().lower()
                         if confirm == 'y':
@@ -539,100 +2757,217 @@ class CWAOffboarding:
                 except Exception as e:
                     print_error(f"Invalid input: {str(e)}. Please try again.")
 
-    def export_passwords(self, selected_clients, output_file=None):
+    def _export_rows(self, passwords, client_name, fields=None):
+        """
+        Project one page of deploymentlogins rows onto the export columns
+
+        `fields` limits the columns after ClientName/ClientId (default: all LOGIN_FIELDS).
+        """
+        if fields is not None and fields != list(LOGIN_FIELDS):
+            return [(client_name, p['Client']['ClientId'], *(p.get(field) for field in fields)) for p in passwords]
+        return [
+            (client_name, p['Client']['ClientId'], p.get('Title'), p.get('Username'),
+             p.get('Password'), p.get('Notes'), p.get('Url'))
+            for p in passwords
+        ]
+
+    @staticmethod
+    def _split_filename(filename, extension):
+        """(stem, extension) of a file name, keeping `extension` (e.g. jsonl.gz.enc) whole if it matches"""
+        if filename.lower().endswith('.' + extension.lower()):
+            return filename[:-len(extension) - 1], filename[-len(extension):]
+        encrypted = extension.endswith(ExportEncryption.SUFFIX)
+        plain = extension[:-len(ExportEncryption.SUFFIX)] if encrypted else extension
+        if filename.lower().endswith('.' + plain.lower()):
+            stem, file_extension = filename[:-len(plain) - 1], filename[-len(plain):]
+        elif '.' in filename:
+            stem, file_extension = filename.rsplit('.', 1)
+        else:
+            return filename, extension
+        if encrypted and not file_extension.lower().endswith(ExportEncryption.SUFFIX[1:]):
+            # Ciphertext always gets .enc, so it is never mistaken for plaintext and --decrypt accepts it
+            file_extension += ExportEncryption.SUFFIX
+        return stem, file_extension
+
+    def export_passwords(self, selected_clients, output_file=None, workers=1, combined=False, output_format='csv', resume=False, delta=False,
+                         encryption=None, progress=False, login_query=None):
         """
         Export passwords for selected clients (creates individual CSV per client)
+
+        Up to `workers` clients are fetched in parallel while their pages are
+        normalized and written by the later stages of an ExportPipeline. Results
+        are reported in the order the clients were selected, so the output does
+        not depend on timing.
+        With `combined`, every client's rows are streamed into one file instead,
+        page by page, tagged with ClientName/ClientId.
+        Every result is recorded in an ExportJournal as it settles; with `resume`, clients the
+        journal shows as finished are skipped. With `delta`, only changes since
+        the previous export are written (see DeltaIndex). With an `encryption`
+        (ExportEncryption), files are encrypted as they are written. With
+        `progress`, a ProgressBar with an ETA is kept below the per-client lines.
+        A `login_query` (LoginQuery) filters rows and picks columns server-side.
         """
         timestamp = datetime.now().strftime("%Y.%m.%d")
-        print_info(f"Exporting passwords for {len(selected_clients)} client(s)...")
 
-        deploymentloginidsurl = "/cwa/api/v1/clients/{cwclientid}/deploymentlogins?pagesize=-1&condition=&orderBy=title%20asc&includeFields=password,Username,Title,Notes,Url"
+        delta_index = DeltaIndex(self.output_dir, self.base_url) if delta else None
+        login_query = login_query or LoginQuery()
+        columns = DELTA_COLUMNS if delta else login_query.columns
+        suffix = "_delta" if delta else ""
+        extension = output_format + (ExportEncryption.SUFFIX if encryption else "")
+
+        journal = ExportJournal(self.output_dir, self.base_url)
+        output_directory = OutputDirectory(self.output_dir)
+        skipped_count = 0
+        resume_file = None
+        if resume:
+            # A file lost to a crash before it was published doesn't count as exported
+            completed = {client_id: entry for client_id, entry in journal.completed().items()
+                         if not entry.get('file') or os.path.exists(entry['file'])}
+            remaining = [client for client in selected_clients if str(client.id) not in completed]
+            skipped_count = len(selected_clients) - len(remaining)
+            if skipped_count:
+                print_info(f"Resuming: skipping {skipped_count} client(s) already exported")
+            # A resumed combined export keeps appending to the same file, where the format allows
+            resume_file = next((entry['file'] for entry in reversed(list(completed.values()))
+                                if entry.get('combined') and entry.get('file')), None)
+            if resume_file and not (output_format in APPENDABLE_FORMATS and not encryption and resume_file.endswith('.' + extension)):
+                resume_file = None
+            selected_clients = remaining
+        else:
+            journal.reset()
+
+        workers = max(1, min(workers, len(selected_clients) or 1))
+        print_info(f"Exporting passwords for {len(selected_clients)} client(s) using {workers} worker(s)...")
 
         success_count = 0
         fail_count = 0
+        unchanged_count = 0
+        rows_count = 0
         exported_files = []
 
-        # Process each client individually
-        for idx, row in selected_clients.iterrows():
-            cwclientid = row['Id']
-            client_name = row['Name']
-
-            try:
-                url = self.base_url + deploymentloginidsurl.format(cwclientid=cwclientid)
-                resp = requests.get(url, headers=self.headers)
-
-                if resp.status_code in [200, 201]:
-                    passwords = resp.json()
-
-                    if passwords:
-                        # Generate filename for this specific client
-                        safe_name = "".join(c for c in client_name if c.isalnum() or c in (' ', '-', '_')).strip()
-                        safe_name = safe_name.replace(' ', '_')
-
-                        # Use provided output_file as base if single client, otherwise generate
-                        if len(selected_clients) == 1 and output_file:
-                            client_output_file = self.output_dir / output_file
-                        else:
-                            client_output_file = self.output_dir / f"{safe_name}_{timestamp}.csv"
-
-                        # Convert to string for pandas
-                        client_output_file = str(client_output_file)
-
-                        # Create DataFrame for this client
-                        df = pd.DataFrame(passwords)
-                        df['ClientId'] = df['Client'].apply(lambda x: x['ClientId'])
-                        df['ClientName'] = client_name
-                        df = df[["ClientName", "ClientId", "Title", "Username", "Password", "Notes", "Url"]]
-
-                        # Try to save with error handling
-                        save_successful = False
-                        original_filename = client_output_file
-                        attempt = 0
-
-                        while not save_successful and attempt < 5:
-                            try:
-                                df.to_csv(client_output_file, index=False)
-                                save_successful = True
-                                exported_files.append(client_output_file)
-                                success_count += 1
-                                print(f"  {Colors.GREEN}✓{Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.CYAN}({len(passwords)} passwords){Colors.RESET} → {Colors.YELLOW}{client_output_file}{Colors.RESET}")
-
-                            except PermissionError:
-                                attempt += 1
-                                if attempt < 5:
-                                    base, ext = original_filename.rsplit('.', 1) if '.' in original_filename else (original_filename, 'csv')
-                                    client_output_file = f"{base}_{attempt}.{ext}"
-                                else:
-                                    print(f"  {Colors.RED}✗{Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.RED}(Permission denied - file may be open){Colors.RESET}")
-                                    fail_count += 1
-                                    break
-
-                            except Exception as e:
-                                print(f"  {Colors.RED}✗{Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.RED}(Error saving: {str(e)}){Colors.RESET}")
-                                fail_count += 1
-                                break
-
-                    else:
-                        print(f"  {Colors.YELLOW}⚠{Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.YELLOW}(No passwords found){Colors.RESET}")
-                        success_count += 1  # Still count as success since API call worked
-
+        combined_writer = None
+        if combined:
+            if resume_file:
+                combined_writer = ExportWriter(resume_file, output_format, append=True, columns=columns)
+            else:
+                # A resumed Parquet/XLSX/encrypted export can't append, so it gets the next free name
+                combined_file = output_directory.allocate(*self._split_filename(output_file or f"All_Clients_{timestamp}{suffix}.{extension}", extension))
+                combined_writer = ExportWriter(str(combined_file), output_format, columns=columns, encryption=encryption,
+                                               output_directory=output_directory)
+
+        # Work out every output filename up front so parallel workers never write to the same file,
+        # and no earlier export in the directory is overwritten
+        tasks = []
+        claimed_stems = set()
+        for client in selected_clients:
+            cwclientid = client.id
+            client_name = client.name
+
+            if combined_writer:
+                tasks.append((cwclientid, client_name, combined_writer))
+                continue
+
+            # Generate filename for this specific client
+            safe_name = "".join(c for c in client_name if c.isalnum() or c in (' ', '-', '_')).strip()
+            safe_name = safe_name.replace(' ', '_')
+
+            # Use provided output_file as base if single client, otherwise generate
+            if len(selected_clients) == 1 and output_file:
+                stem, file_extension = self._split_filename(output_file, extension)
+            else:
+                stem, file_extension = f"{safe_name}_{timestamp}{suffix}", extension
+                if stem in claimed_stems:
+                    stem = f"{safe_name}_{cwclientid}_{timestamp}{suffix}"
+                claimed_stems.add(stem)
+            client_output_file = output_directory.allocate(stem, file_extension)
+
+            tasks.append((cwclientid, client_name, ExportWriter(str(client_output_file), output_format, columns=columns,
+                                                                encryption=encryption, output_directory=output_directory)))
+
+        # Results are collected in selection order, keeping the report deterministic
+        pipeline = ExportPipeline(self, tasks, workers=workers, shared_writer=combined, delta_index=delta_index,
+                                  login_query=login_query, journal=journal)
+        progress_bar = ProgressBar(len(tasks)) if progress else None
+        done_count = 0
+        self.metrics.export_started = time.perf_counter()
+        try:
+            for (cwclientid, client_name, _), result in pipeline.run():
+                status, detail, saved_file, password_count = result
+                if progress_bar:
+                    progress_bar.clear()
+
+                if status == 'success':
+                    if saved_file not in exported_files:
+                        exported_files.append(saved_file)
+                    success_count += 1
+                    rows_count += password_count
+                    print(f"  {Colors.GREEN}✓{Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.CYAN}({detail}){Colors.RESET} → {Colors.YELLOW}{saved_file}{Colors.RESET}")
+                elif status == 'empty':
+                    print(f"  {Colors.YELLOW}⚠{Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.YELLOW}({detail}){Colors.RESET}")
+                    success_count += 1  # Still count as success since API call worked
+                elif status == 'unchanged':
+                    print(f"  {Colors.CYAN}={Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.CYAN}({detail}){Colors.RESET}")
+                    success_count += 1
+                    unchanged_count += 1
                 else:
                     fail_count += 1
-                    print(f"  {Colors.RED}✗{Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.RED}(Failed - Status {resp.status_code}){Colors.RESET}")
+                    print(f"  {Colors.RED}✗{Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.RED}({detail}){Colors.RESET}")
 
-            except Exception as e:
-                fail_count += 1
-                print(f"  {Colors.RED}✗{Colors.RESET} {Colors.WHITE}{client_name}{Colors.RESET} {Colors.RED}(Error: {str(e)}){Colors.RESET}")
+                done_count += 1
+                if progress_bar:
+                    progress_bar.update(done_count, rows_count)
+
+        except KeyboardInterrupt:
+            # The pipeline drops unfinished clients on the way out; the journal keeps progress
+            print_warning("Export interrupted - re-run with --resume to continue where it stopped")
+            raise
+
+        finally:
+            self.metrics.export_finished = time.perf_counter()
+            if progress_bar:
+                progress_bar.finish()
+            if combined_writer:
+                combined_writer.close()
+            output_directory.sync()
+            if delta_index:
+                delta_index.save()
+
+        if combined_writer:
+            if combined_writer.output_file:
+                print_info(f"Combined export: {combined_writer.rows_written} passwords → {combined_writer.output_file}")
+
+        self.last_summary = {
+            'exported': success_count,
+            'failed': fail_count,
+            'skipped': skipped_count,
+            'unchanged': unchanged_count,
+            'rows': rows_count,
+            'files': exported_files,
+        }
 
         # Summary
-        if success_count > 0:
+        if success_count > 0 or skipped_count > 0:
             print(f"\n{Colors.BOLD}{Colors.GREEN}{'='*100}{Colors.RESET}")
             print(f"{Colors.BOLD}{Colors.GREEN}✓ Export complete!{Colors.RESET}")
             print(f"{Colors.BOLD}{Colors.GREEN}{'='*100}{Colors.RESET}")
             print(f"{Colors.CYAN}  • Successfully exported: {Colors.WHITE}{success_count} client(s){Colors.RESET}")
             print(f"{Colors.CYAN}  • Failed: {Colors.WHITE}{fail_count} client(s){Colors.RESET}")
+            if skipped_count:
+                print(f"{Colors.CYAN}  • Skipped (already exported): {Colors.WHITE}{skipped_count} client(s){Colors.RESET}")
+            if delta:
+                print(f"{Colors.CYAN}  • Unchanged since last export: {Colors.WHITE}{unchanged_count} client(s){Colors.RESET}")
             print(f"{Colors.CYAN}  • Files created: {Colors.WHITE}{len(exported_files)}{Colors.RESET}")
 
+            stats = self.get_request_stats()
+            if stats['requests']:
+                print(f"{Colors.CYAN}  • API requests: {Colors.WHITE}{stats['requests']} ({stats['retries']} retries, {stats['errors']} errors, {stats['bytes'] / 2**20:.1f} MB received){Colors.RESET}")
+                print(f"{Colors.CYAN}  • API latency: {Colors.WHITE}avg {stats['avg']*1000:.0f} ms, p50 {stats['p50']*1000:.0f} ms, p95 {stats['p95']*1000:.0f} ms, max {stats['max']*1000:.0f} ms{Colors.RESET}")
+            if self.rate_controller and self.rate_controller.decreases:
+                control = self.rate_controller.to_dict()
+                rps = f", {control['rps']} req/s" if control['rps'] is not None else ""
+                print(f"{Colors.CYAN}  • Rate control: {Colors.WHITE}{control['throttled']} throttled, "
+                      f"{control['decreases']} slow-downs, ended at {control['limit']} in flight{rps}{Colors.RESET}")
+
             if exported_files:
                 print(f"\n{Colors.CYAN}Exported files:{Colors.RESET}")
                 for file in exported_files:
@@ -645,6 +2980,58 @@ class CWAOffboarding:
             print_error("No passwords retrieved. Export cancelled.")
             return False
 
+# Process exit codes (for schedulers and CI)
+EXIT_OK = 0
+EXIT_EXPORT_FAILED = 1      # Some clients failed, or the run could not start
+EXIT_USAGE = 2              # Missing or invalid options / batch config
+EXIT_AUTH_FAILED = 3        # No working bearer token
+EXIT_CLIENT_LIST_FAILED = 4 # The client list could not be retrieved
+EXIT_NO_CLIENTS = 5         # Nothing matched the selection
+EXIT_SERVER_UNREACHABLE = 6 # The server could not be reached to check the bearer token
+EXIT_INTERRUPTED = 130      # Ctrl+C
+
+def parse_client_ids(values):
+    """
+    Client IDs from --client-ids text or a batch config list, as unique ints in order
+
+    Returns None (after printing which one) if an ID is not a number.
+    """
+    if isinstance(values, str):
+        values = values.split(',')
+
+    client_ids = []
+    for value in values:
+        value = str(value).strip()
+        if not value:
+            continue
+        if not value.isdigit():
+            print_error(f"Invalid client ID '{value}' - client IDs are numbers")
+            return None
+        if int(value) not in client_ids:
+            client_ids.append(int(value))
+    return client_ids
+
+def read_credentials(args):
+    """
+    Collect a bearer token and client ID without prompting
+
+    Command-line values win over the CWA_BEARER_TOKEN / CWA_CLIENTID
+    environment variables; with --token-stdin the token (and optionally the
+    client ID on a second line) is read from standard input instead, which
+    keeps it out of the process list and shell history.
+    Returns (bearer_token, clientid); either may be None.
+    """
+    bearer_token = args.bearer_token or os.environ.get('CWA_BEARER_TOKEN')
+    clientid = args.clientid or os.environ.get('CWA_CLIENTID')
+
+    if args.token_stdin:
+        lines = [line.strip() for line in sys.stdin.read().splitlines() if line.strip()]
+        if lines:
+            bearer_token = lines[0]
+        if len(lines) > 1 and not args.clientid:
+            clientid = lines[1]
+
+    return bearer_token, clientid
 
 def main():
     parser = argparse.ArgumentParser(
@@ -660,6 +3047,12 @@ Examples:
 
   Manual credentials:
     python cns4u_offboarding.py --manual --clientid "xxx" --bearer_token "bearer xxx"
+
+  Scheduled job (never prompts; token from CWA_BEARER_TOKEN / CWA_CLIENTID):
+    python cns4u_offboarding.py --non-interactive --base_url "https://cns4u.hostedrmm.com" --client-ids "123,456"
+
+Exit codes: 0 success, 1 export failures, 2 usage error, 3 authentication failed,
+4 client list unavailable, 5 no clients matched, 6 server unreachable, 130 interrupted
         """
     )
 
@@ -674,22 +3067,138 @@ Examples:
     parser.add_argument("--base_url", type=str,
                        help="Base URL (e.g., https://cns4u.hostedrmm.com)")
     parser.add_argument("--output_file", type=str,
-                       help="Output CSV filename")
+                       help="Output filename (single client or --combined export)")
     parser.add_argument("--output_dir", type=str,
                        help="Directory to save CSV files (default: current directory)")
     parser.add_argument("--client-ids", type=str,
                        help="Comma-separated client IDs to export (skip interactive selection)")
+    parser.add_argument("--workers", type=int, default=4,
+                       help="Number of clients to export in parallel (default: 4)")
+    parser.add_argument("--pool-size", type=int,
+                       help="HTTP connection pool size (default: the larger of 10 and --workers)")
+    parser.add_argument("--timeout", type=float, default=30,
+                       help="Per-request timeout in seconds (default: 30)")
+    parser.add_argument("--retries", type=int, default=3,
+                       help="Retries for throttled (429), 5xx or failed requests (default: 3)")
+    parser.add_argument("--max-rps", type=float,
+                       help="Never send more than this many API requests per second (default: adapt to the server)")
+    parser.add_argument("--no-rate-control", action="store_true",
+                       help="Don't slow down when the server throttles (429/503) or latency climbs")
+    parser.add_argument("--page-size", type=int, default=1000,
+                       help="Rows requested per API page; -1 fetches everything in one request (default: 1000)")
+    parser.add_argument("--combined", action="store_true",
+                       help="Write all selected clients to one file instead of one file per client")
+    parser.add_argument("--format", type=str, choices=OUTPUT_FORMATS, default="csv",
+                       help="Output file format; jsonl.zst, parquet and xlsx need zstandard, pyarrow or openpyxl (default: csv)")
+    parser.add_argument("--no-token-cache", action="store_true",
+                       help="Do not read or write the encrypted bearer token cache")
+    parser.add_argument("--clear-token-cache", action="store_true",
+                       help="Delete all cached bearer tokens before starting")
+    parser.add_argument("--token-ttl", type=int, default=60,
+                       help="Minutes a cached bearer token is reused before logging in again (default: 60)")
+    parser.add_argument("--browser-profile", type=str,
+                       help="Chrome profile directory kept between runs for headless token refresh (default: a throwaway profile)")
+    parser.add_argument("--resume", action="store_true",
+                       help="Skip clients that an earlier, interrupted export to the same output directory already finished")
+    parser.add_argument("--delta", action="store_true",
+                       help="Only write passwords added, changed or removed since the previous --delta export to the same output directory")
+    parser.add_argument("--no-client-cache", action="store_true",
+                       help="Always download the client list instead of showing the cached one first")
+    parser.add_argument("--client-cache-ttl", type=float, default=24,
+                       help="Hours a cached client list is shown while it refreshes in the background (default: 24)")
+    parser.add_argument("--timings", action="store_true",
+                       help="Print a startup and per-phase timing report at the end of the run")
+    parser.add_argument("--title-match", type=str,
+                       help="Only export logins whose Title contains this text (filtered by the server)")
+    parser.add_argument("--url-domain", type=str,
+                       help="Only export logins whose Url contains this domain (filtered by the server)")
+    parser.add_argument("--modified-since", type=str, metavar="DATE",
+                       help="Only export logins changed on or after DATE (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS)")
+    parser.add_argument("--fields", type=str,
+                       help=f"Comma-separated login fields to export (default: {','.join(LOGIN_FIELDS)}); ClientName and ClientId are always included")
+    parser.add_argument("--metrics-file", type=str,
+                       help="Write phase timings, request/byte/retry counts and per-client stage timings to this JSON file")
+    parser.add_argument("--progress", action="store_true",
+                       help="Show a live progress bar with throughput and ETA during the export")
+    parser.add_argument("--batch", type=str, metavar="CONFIG",
+                       help="Export from every Automate server listed in a JSON (or YAML) batch config, without prompts")
+    parser.add_argument("--non-interactive", action="store_true",
+                       help="Never prompt (for cron/CI): needs --base_url and --client-ids; fails with an exit code instead of asking")
+    parser.add_argument("--token-stdin", action="store_true",
+                       help="Read the bearer token (and optionally the client ID on a second line) from standard input")
+    parser.add_argument("--encrypt", action="store_true",
+                       help="Encrypt export files as they are written (AES-GCM, passphrase from CWA_EXPORT_PASSPHRASE or a prompt)")
+    parser.add_argument("--decrypt", type=str, nargs='+', metavar="FILE",
+                       help="Decrypt .enc export files next to the originals and exit")
 
     args = parser.parse_args()
+    record_timing("Startup (imports + args)")
+
+    exit_code = None
+    try:
+        if args.decrypt:
+            exit_code = run_decrypt(args)
+        elif args.batch:
+            exit_code = run_batch(args)
+        else:
+            exit_code = run(args)
+    except KeyboardInterrupt:
+        print_warning("Interrupted")
+        exit_code = EXIT_INTERRUPTED
+    finally:
+        if args.timings:
+            print_timings()
+        if args.metrics_file:
+            write_metrics_file(args.metrics_file, args, exit_code)
+
+    return exit_code
+
+
+def run(args):
+    """
+    Run the offboarding workflow for parsed command-line arguments
+
+    Returns one of the EXIT_* codes. With --non-interactive nothing is ever
+    prompted for: missing options or credentials end the run with an exit code.
+    """
+    non_interactive = args.non_interactive
 
     # Print the banner
     print_banner()
 
-    # Check dependencies first
-    if not check_and_fix_dependencies():
+    bearer_token, clientid = read_credentials(args)
+    if non_interactive:
+        missing = [option for option, value in (("--base_url", args.base_url), ("--client-ids", args.client_ids)) if not value]
+        if missing:
+            print_error(f"--non-interactive needs {' and '.join(missing)}")
+            return EXIT_USAGE
+
+    login_query = build_login_query(args.title_match, args.url_domain, args.modified_since, args.fields)
+    if login_query is None:
+        return EXIT_USAGE
+    if args.delta and not login_query.is_default:
+        # Rows outside a filter would show up as removed, and fingerprints cover every field
+        print_error("--delta can't be combined with --title-match, --url-domain, --modified-since or --fields")
+        return EXIT_USAGE
+
+    client_id_list = None
+    if args.client_ids:
+        client_id_list = parse_client_ids(args.client_ids)
+        if not client_id_list:
+            print_error("--client-ids needs at least one numeric client ID")
+            return EXIT_USAGE
+
+    if not check_output_format(args.format, args.encrypt):
+        return EXIT_USAGE
+
+    # Check dependencies first (the browser is only needed for interactive automated login;
+    # an unattended headless refresh simply fails over if Chrome is missing)
+    dependencies_ok = check_and_fix_dependencies(browser_required=not (args.manual or non_interactive))
+    record_timing("Dependency check")
+    if not dependencies_ok:
         print(f"\n{Colors.RED}Please fix the dependencies above and try again.{Colors.RESET}")
         input(f"\n{Colors.YELLOW}Press Enter to exit...{Colors.RESET}")
-        return
+        return EXIT_EXPORT_FAILED
 
     # Get base URL if not provided
     base_url = args.base_url
@@ -705,7 +3214,7 @@ Examples:
 
     # Get output directory
     output_dir = args.output_dir
-    if not output_dir:
+    if not output_dir and not non_interactive:
         print(f"\n{Colors.CYAN}Where would you like to save the CSV files?{Colors.RESET}")
         print(f"{Colors.YELLOW}Press Enter for current directory, or type a path:{Colors.RESET}")
         output_dir_input = input(f"{Colors.BOLD}{Colors.CYAN}Output directory: {Colors.RESET}").strip()
@@ -718,22 +3227,54 @@ Examples:
     if output_dir:
         print_info(f"CSV files will be saved to: {output_dir}")
 
-    offboarding = CWAOffboarding(base_url=base_url, output_dir=output_dir)
-
-    # Step 1: Get credentials
-    if args.manual:
-        if args.clientid and args.bearer_token:
-            offboarding.clientid = args.clientid
-            offboarding.bearer_token = args.bearer_token
-            offboarding.headers = {
-                "authorization": args.bearer_token,
-                "clientid": args.clientid,
-                "accept": "application/json"
-            }
-        else:
-            offboarding.get_credentials_manual()
+    encryption = None
+    if args.encrypt:
+        encryption = create_export_encryption(non_interactive)
+        if encryption is None:
+            return EXIT_USAGE
+
+    pool_size = args.pool_size or max(10, args.workers)
+    offboarding = CWAOffboarding(base_url=base_url, output_dir=output_dir, pool_size=pool_size,
+                                 timeout=args.timeout, max_retries=args.retries, page_size=args.page_size,
+                                 rate_control=not args.no_rate_control, max_rps=args.max_rps)
+    record_timing("Setup (prompts + HTTP session)")
+
+    token_cache = None if args.no_token_cache else TokenCache(ttl=args.token_ttl * 60)
+    if args.clear_token_cache:
+        TokenCache().clear()
+        print_info("Cleared cached bearer tokens")
+
+    # Only an explicitly requested Chrome profile (and its login session) is kept between runs
+    profile_dir = os.path.expanduser(args.browser_profile) if args.browser_profile else None
+
+    # A saved profile allows an unattended headless login; without one, only a prompt could
+    use_browser = not args.manual and (not non_interactive or bool(profile_dir and os.path.isdir(profile_dir)))
+
+    # Step 1: Get credentials (explicit credentials win over the cache)
+    used_cached_token = False
+    if bearer_token and clientid:
+        offboarding.set_credentials(bearer_token, clientid)
+        if non_interactive:
+            valid = offboarding.validate_credentials()
+            if valid is False:
+                print_error("The server rejected the supplied bearer token")
+                return EXIT_AUTH_FAILED
+            if valid is None:
+                print_error(f"Could not reach {offboarding.base_url} to check the bearer token "
+                            "(network error or server unavailable)")
+                return EXIT_SERVER_UNREACHABLE
+    elif token_cache and offboarding.load_cached_credentials(token_cache):
+        used_cached_token = True
+    elif non_interactive:
+        if not offboarding.refresh_credentials(token_cache, profile_dir=profile_dir, interactive=False, use_browser=use_browser):
+            print_error("No bearer token - pass --bearer_token/--clientid, set CWA_BEARER_TOKEN/CWA_CLIENTID, "
+                        "use --token-stdin, or keep a logged-in --browser-profile")
+            return EXIT_AUTH_FAILED
+        used_cached_token = True  # refresh_credentials already cached it
+    elif args.manual:
+        offboarding.get_credentials_manual()
     elif args.auto_login:
-        success = offboarding.get_credentials_automated()
+        success = offboarding.get_credentials_automated(profile_dir=profile_dir)
         if not success:
             print_warning("Falling back to manual entry...")
             offboarding.get_credentials_manual()
@@ -746,37 +3287,344 @@ Examples:
         choice = input(f"\n{Colors.BOLD}{Colors.CYAN}Your choice (1 or 2): {Colors.RESET}").strip()
 
         if choice == "1":
-            success = offboarding.get_credentials_automated()
+            success = offboarding.get_credentials_automated(profile_dir=profile_dir)
             if not success:
                 print_warning("Falling back to manual entry...")
                 offboarding.get_credentials_manual()
         else:
             offboarding.get_credentials_manual()
 
-    # Step 2: Get all clients
-    clients_df = offboarding.get_all_clients()
+    if not offboarding.headers:
+        print_error("No credentials provided")
+        return EXIT_AUTH_FAILED
+
+    # Cache newly obtained tokens; a reused one keeps its original expiry
+    if token_cache and not used_cached_token:
+        token_cache.put(offboarding.base_url, offboarding.bearer_token, offboarding.clientid)
+    record_timing("Authentication")
+
+    # Refresh the token mid-export instead of failing the remaining clients with 401
+    offboarding.credential_refresher = lambda: offboarding.refresh_credentials(
+        token_cache, profile_dir=profile_dir, interactive=not non_interactive, use_browser=use_browser)
+
+    # Steps 2 and 3: Get and select clients
+    if client_id_list:
+        # Known IDs: look up just those instead of listing the whole tenant
+        selected_clients = offboarding.get_clients_by_id(client_id_list, workers=args.workers)
+        record_timing("Client lookup")
+        if selected_clients is None:
+            print_error("Failed to retrieve clients. Exiting.")
+            return EXIT_CLIENT_LIST_FAILED
+    else:
+        client_cache = None if args.no_client_cache else ClientListCache(ttl=args.client_cache_ttl * 3600)
+        clients = offboarding.get_all_clients(client_cache)
+        record_timing("Client list fetch")
 
-    if clients_df is None or len(clients_df) == 0:
-        print_error("Failed to retrieve clients. Exiting.")
-        return
+        if not clients:
+            print_error("Failed to retrieve clients. Exiting.")
+            return EXIT_CLIENT_LIST_FAILED
 
-    # Step 3: Select clients
-    if args.client_ids:
-        # Use provided client IDs
-        client_id_list = [cid.strip() for cid in args.client_ids.split(',')]
-        selected_clients = clients_df[clients_df['Id'].isin(client_id_list)]
-        print_success(f"Selected {len(selected_clients)} client(s) from provided IDs")
-    else:
         # Interactive selection
-        selected_clients = offboarding.select_clients_interactive(clients_df)
+        selected_clients = offboarding.select_clients_interactive(clients)
+        record_timing("Client selection")
 
     if selected_clients is None or len(selected_clients) == 0:
         print_warning("No clients selected. Exiting.")
-        return
+        return EXIT_NO_CLIENTS
 
     # Step 4: Export passwords
-    offboarding.export_passwords(selected_clients, args.output_file)
+    ok = offboarding.export_passwords(selected_clients, args.output_file, workers=args.workers,
+                                     combined=args.combined, output_format=args.format, resume=args.resume,
+                                     delta=args.delta, encryption=encryption, progress=args.progress,
+                                     login_query=login_query)
+    record_timing("Export")
+
+    if not ok or offboarding.last_summary['failed']:
+        return EXIT_EXPORT_FAILED
+    return EXIT_OK
+
+
+def create_export_encryption(non_interactive=False):
+    """
+    Set up --encrypt: check cryptography is installed and get the passphrase
+
+    Returns an ExportEncryption, or None (after printing why) if that fails.
+    """
+    if importlib.util.find_spec('cryptography') is None:
+        print_error("--encrypt needs the cryptography package: pip install cryptography")
+        return None
+    passphrase = get_export_passphrase(non_interactive)
+    if not passphrase:
+        print_error("--encrypt needs a passphrase (set CWA_EXPORT_PASSPHRASE for unattended runs)")
+        return None
+    return ExportEncryption(passphrase)
+
+def run_decrypt(args):
+    """
+    Decrypt the .enc files given to --decrypt next to the originals (without .enc)
+    """
+    if importlib.util.find_spec('cryptography') is None:
+        print_error("--decrypt needs the cryptography package: pip install cryptography")
+        return EXIT_USAGE
+
+    passphrase = os.environ.get('CWA_EXPORT_PASSPHRASE')
+    if not passphrase and not args.non_interactive:
+        passphrase = getpass.getpass(f"{Colors.CYAN}Export passphrase: {Colors.RESET}")
+    if not passphrase:
+        print_error("No passphrase (set CWA_EXPORT_PASSPHRASE)")
+        return EXIT_USAGE
+
+    failed = 0
+    for encrypted_file in args.decrypt:
+        if not encrypted_file.endswith(ExportEncryption.SUFFIX):
+            print_error(f"{encrypted_file}: expected a {ExportEncryption.SUFFIX} file")
+            failed += 1
+            continue
+        output_file = encrypted_file[:-len(ExportEncryption.SUFFIX)]
+        if os.path.exists(output_file):
+            print_error(f"{output_file} already exists - not overwriting it")
+            failed += 1
+            continue
+        try:
+            ExportEncryption.decrypt_file(encrypted_file, output_file, passphrase)
+            print_success(f"Decrypted {encrypted_file} → {output_file}")
+        except (OSError, ValueError) as e:
+            print_error(f"{encrypted_file}: {str(e)}")
+            failed += 1
+
+    return EXIT_EXPORT_FAILED if failed else EXIT_OK
+
+# Per-tenant settings a batch config may set (in "defaults" or on a tenant)
+BATCH_TENANT_KEYS = {
+    'name', 'base_url', 'output_dir', 'client_ids', 'bearer_token', 'clientid',
+    'bearer_token_env', 'clientid_env', 'token_cache', 'browser_profile',
+    'workers', 'pool_size', 'timeout', 'retries', 'page_size', 'combined', 'rate_control', 'max_rps',
+    'format', 'resume', 'delta', 'encrypt', 'title_match', 'url_domain', 'modified_since', 'fields',
+}
+
+def load_batch_config(config_file):
+    """
+    Read and check a batch config; returns the parsed dict or None
+
+    JSON is always supported; .yaml/.yml files need PyYAML.
+    """
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            if config_file.lower().endswith(('.yaml', '.yml')):
+                try:
+                    import yaml
+                except ImportError:
+                    print_error("YAML batch configs need PyYAML (pip install pyyaml) - or use JSON")
+                    return None
+                config = yaml.safe_load(f)
+            else:
+                config = json.load(f)
+    except (OSError, ValueError) as e:
+        print_error(f"Could not read batch config {config_file}: {str(e)}")
+        return None
+
+    if not isinstance(config, dict) or not isinstance(config.get('tenants'), list) or not config['tenants']:
+        print_error("Batch config needs a non-empty \"tenants\" list")
+        return None
+
+    names = set()
+    for position, tenant in enumerate([config.get('defaults', {})] + config['tenants']):
+        label = "defaults" if position == 0 else f"tenant {position}"
+        if not isinstance(tenant, dict):
+            print_error(f"Batch config: {label} must be an object")
+            return None
+        unknown = set(tenant) - BATCH_TENANT_KEYS
+        if unknown:
+            print_error(f"Batch config: unknown setting(s) for {label}: {', '.join(sorted(unknown))}")
+            return None
+        if 'client_ids' in tenant and parse_client_ids(tenant['client_ids']) is None:
+            return None
+        if position == 0:
+            continue
+        if not tenant.get('base_url'):
+            print_error(f"Batch config: {label} has no base_url")
+            return None
+        name = tenant.setdefault('name', tenant['base_url'].split('//')[-1].split('/')[0])
+        if name in names:
+            print_error(f"Batch config: tenant name '{name}' is used twice")
+            return None
+        names.add(name)
+
+    return config
+
+def export_tenant(tenant, settings, output_dir, encryption=None):
+    """
+    Authenticate against one Automate server and export its selected clients
+
+    Never prompts: the token comes from the config, environment variables,
+    the token cache or a headless refresh with a saved browser profile.
+    Returns a result dict for the consolidated batch summary.
+    """
+    name = tenant['name']
+    result = {'name': name, 'base_url': tenant['base_url'], 'status': 'failed', 'summary': None}
+
+    workers = settings['workers']
+    offboarding = CWAOffboarding(base_url=tenant['base_url'], output_dir=str(output_dir),
+                                 pool_size=settings.get('pool_size') or max(10, workers),
+                                 timeout=settings['timeout'], max_retries=settings['retries'],
+                                 page_size=settings['page_size'], rate_control=settings.get('rate_control', True),
+                                 max_rps=settings.get('max_rps'))
+
+    token_cache = TokenCache(ttl=settings['token_ttl'] * 60) if settings.get('token_cache', True) else None
+    profile_dir = settings.get('browser_profile')
+    if profile_dir:
+        profile_dir = os.path.expanduser(profile_dir)
+
+    bearer_token = settings.get('bearer_token')
+    clientid = settings.get('clientid')
+    if settings.get('bearer_token_env'):
+        bearer_token = os.environ.get(settings['bearer_token_env'])
+    if settings.get('clientid_env'):
+        clientid = os.environ.get(settings['clientid_env'])
+
+    print_info(f"[{name}] Authenticating...")
+    if bearer_token and clientid:
+        offboarding.set_credentials(bearer_token, clientid)
+    elif not (token_cache and offboarding.load_cached_credentials(token_cache)):
+        if not offboarding.refresh_credentials(token_cache, profile_dir=profile_dir, interactive=False,
+                                               use_browser=bool(profile_dir)):
+            print_error(f"[{name}] No usable bearer token (set it in the config, an environment variable, the token cache or a browser_profile)")
+            result['status'] = 'auth failed'
+            return result
+
+    offboarding.credential_refresher = lambda: offboarding.refresh_credentials(
+        token_cache, profile_dir=profile_dir, interactive=False, use_browser=bool(profile_dir))
+
+    if settings.get('client_ids'):
+        client_ids = parse_client_ids(settings['client_ids'])
+        clients = offboarding.get_clients_by_id(client_ids, workers=workers) if client_ids else []
+    else:
+        clients = offboarding.get_all_clients()
+    if clients is None:
+        result['status'] = 'client list failed'
+        return result
+    if not clients:
+        result['status'] = 'no clients'
+        return result
+
+    print_info(f"[{name}] Exporting {len(clients)} client(s)")
+    ok = offboarding.export_passwords(clients, workers=workers, combined=settings.get('combined', False),
+                                      output_format=settings['format'], resume=settings.get('resume', False),
+                                      delta=settings.get('delta', False),
+                                      encryption=encryption if settings.get('encrypt') else None,
+                                      login_query=settings.get('login_query'))
+    result['summary'] = offboarding.last_summary
+    result['status'] = 'ok' if ok and not offboarding.last_summary['failed'] else 'partial' if ok else 'failed'
+    return result
+
+def run_batch(args):
+    """
+    Export from every tenant in a batch config without prompting, then print one summary
+
+    Tenants run in parallel (`parallel_tenants`, default 2), each with its own
+    CWAOffboarding, worker count and connection pool, and write into their
+    own subdirectory of the batch output directory. Command-line options such
+    as --workers or --format act as defaults below the config's "defaults".
+    Returns EXIT_OK if every tenant exported without failures.
+    """
+    print_banner()
+    config = load_batch_config(args.batch)
+    if config is None:
+        return EXIT_USAGE
+
+    base_settings = {
+        'workers': args.workers, 'pool_size': args.pool_size, 'timeout': args.timeout,
+        'retries': args.retries, 'page_size': args.page_size, 'combined': args.combined,
+        'format': args.format, 'resume': args.resume, 'delta': args.delta,
+        'token_cache': not args.no_token_cache, 'browser_profile': args.browser_profile,
+        'token_ttl': args.token_ttl, 'encrypt': args.encrypt, 'title_match': args.title_match,
+        'url_domain': args.url_domain, 'modified_since': args.modified_since, 'fields': args.fields,
+        'rate_control': not args.no_rate_control, 'max_rps': args.max_rps,
+    }
+    base_settings.update(config.get('defaults', {}))
+    tenants = config['tenants']
+    tenant_settings = [dict(base_settings, **tenant) for tenant in tenants]
+
+    if not all(check_output_format(settings['format'], settings.get('encrypt')) for settings in tenant_settings):
+        return EXIT_USAGE
+    login_queries = [build_login_query(settings.get('title_match'), settings.get('url_domain'),
+                                       settings.get('modified_since'), settings.get('fields'))
+                     for settings in tenant_settings]
+    if None in login_queries:
+        return EXIT_USAGE
+    for tenant, settings, login_query in zip(tenants, tenant_settings, login_queries):
+        if settings.get('delta') and not login_query.is_default:
+            print_error(f"Batch config: tenant '{tenant['name']}' combines delta with a filter or fields")
+            return EXIT_USAGE
+        settings['login_query'] = login_query
+
+    output_root = Path(args.output_dir or config.get('output_dir') or '.')
+    # Tenants sharing a directory would overwrite each other's combined files, delta index and journal
+    tenant_dirs = {}
+    for tenant, settings in zip(tenants, tenant_settings):
+        safe_name = "".join(c for c in tenant['name'] if c.isalnum() or c in ('-', '_', '.')) or 'tenant'
+        tenant_dir = output_root / (settings.get('output_dir') or safe_name)
+        other = tenant_dirs.get(os.path.normcase(os.path.abspath(tenant_dir)))
+        if other:
+            print_error(f"Batch config: tenants '{other}' and '{tenant['name']}' both write to {tenant_dir} - give each its own output_dir")
+            return EXIT_USAGE
+        tenant_dirs[os.path.normcase(os.path.abspath(tenant_dir))] = tenant['name']
+        settings['output_dir'] = tenant_dir
+
+    # One passphrase (from CWA_EXPORT_PASSPHRASE - batch mode never prompts) for all tenants
+    encryption = None
+    if any(settings.get('encrypt') for settings in tenant_settings):
+        encryption = create_export_encryption(non_interactive=True)
+        if encryption is None:
+            return EXIT_USAGE
+
+    browser_required = any(settings.get('browser_profile') for settings in tenant_settings)
+    if not check_and_fix_dependencies(browser_required=browser_required):
+        return EXIT_EXPORT_FAILED
+
+    parallel = max(1, min(int(config.get('parallel_tenants', 2)), len(tenants)))
+    print_info(f"Batch export of {len(tenants)} Automate server(s), {parallel} at a time → {output_root}")
+
+    def run_tenant(tenant, settings):
+        try:
+            return export_tenant(tenant, settings, settings['output_dir'], encryption)
+        except Exception as e:
+            print_error(f"[{tenant['name']}] {str(e)}")
+            return {'name': tenant['name'], 'base_url': tenant['base_url'], 'status': 'failed', 'summary': None}
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(run_tenant, tenants, tenant_settings))
+    record_timing("Batch export")
+
+    # Consolidated summary, in config order
+    print(f"\n{Colors.BOLD}{Colors.MAGENTA}{'='*100}{Colors.RESET}")
+    print(f"{Colors.BOLD}{Colors.MAGENTA}Batch summary{Colors.RESET}")
+    print(f"{Colors.BOLD}{Colors.MAGENTA}{'='*100}{Colors.RESET}")
+    print(f"{Colors.BOLD}{'Tenant':<30} {'Status':<20} {'Exported':>9} {'Failed':>7} {'Skipped':>8} {'Passwords':>10} {'Files':>6}{Colors.RESET}")
+    totals = {'exported': 0, 'failed': 0, 'skipped': 0, 'rows': 0, 'files': 0}
+    for result in results:
+        summary = result['summary'] or {'exported': 0, 'failed': 0, 'skipped': 0, 'rows': 0, 'files': []}
+        color = Colors.GREEN if result['status'] == 'ok' else Colors.YELLOW if result['status'] == 'partial' else Colors.RED
+        print(f"{Colors.WHITE}{result['name'][:30]:<30}{Colors.RESET} {color}{result['status']:<20}{Colors.RESET} "
+              f"{summary['exported']:>9} {summary['failed']:>7} {summary['skipped']:>8} {summary['rows']:>10} {len(summary['files']):>6}")
+        for key in ('exported', 'failed', 'skipped', 'rows'):
+            totals[key] += summary[key]
+        totals['files'] += len(summary['files'])
+    print(f"{Colors.BOLD}{'Total':<30} {'':<20} {totals['exported']:>9} {totals['failed']:>7} {totals['skipped']:>8} {totals['rows']:>10} {totals['files']:>6}{Colors.RESET}")
+
+    # Machine-readable copy of the summary for the audit trail
+    output_root.mkdir(parents=True, exist_ok=True)
+    summary_file = output_root / f"batch_summary_{datetime.now().strftime('%Y.%m.%d_%H%M%S')}.json"
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump({'config': os.path.abspath(args.batch), 'tenants': results, 'totals': totals}, f, indent=2, default=str)
+    print_info(f"Batch summary written to {summary_file}")
+
+    if all(result['status'] == 'ok' for result in results):
+        return EXIT_OK
+    if all(result['status'] == 'auth failed' for result in results):
+        return EXIT_AUTH_FAILED
+    return EXIT_EXPORT_FAILED
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Benchmark for the CWA Password Extractor export pipeline
+
+Builds a few thousand synthetic clients and deploymentlogins rows, then times the
+client list handling and per-client export of the row pipeline used by the tool
+against the pandas pipeline it replaced. pandas is only needed for the comparison.
+It also decodes all rows as one response body with json.loads and with the
+streaming decoder (iter_json_array) and reports time and peak memory of each.
+
+With --mock, runs the real client list fetch and export end to end against
+mock_automate_server.py (started as a separate process, so peak RSS is the
+tool's own) and reports clients/sec, rows/sec, request latency p50/p99 and
+peak RSS. --json prints the results as one JSON object for regression tracking.
+
+Usage:
+    python benchmark.py --clients 3000 --rows 10
+    python benchmark.py --mock --clients 500 --rows 20 --latency 0.02 --workers 8
+    python benchmark.py --mock --throttle-every 50 --expire-after 200 --json
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from CW_Automate_PW_Extractor import (CWAOffboarding, Client, ExportWriter, EXPORT_COLUMNS, OUTPUT_FORMATS,
+                                      STREAM_CHUNK_SIZE, iter_json_array)
+
+
+def synthetic_clients(count):
+    """API-shaped client list"""
+    return [{"Id": i, "Name": f"Synthetic Client {i:05d}"} for i in range(1, count + 1)]
+
+
+def synthetic_passwords(client_id, rows):
+    """API-shaped deploymentlogins list for one client"""
+    return [
+        {
+            "Client": {"ClientId": client_id},
+            "Title": f"Login {n}",
+            "Username": f"user{n}@example.com",
+            "Password": f"P@ssw0rd-{client_id}-{n}",
+            "Notes": "Synthetic row",
+            "Url": f"https://app{n}.example.com",
+        }
+        for n in range(rows)
+    ]
+
+
+def time_import(module):
+    """Cold-start import time of a module in a fresh interpreter (seconds)"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return time.perf_counter() - started
+
+
+def bench_rows(offboarding, api_clients, pages, output_dir):
+    """Client list build, search and per-client CSV export with the row pipeline"""
+    started = time.perf_counter()
+    clients = [Client(row.get('Id'), row.get('Name') or '') for row in api_clients]
+    offboarding.search_clients(clients, "client 01")
+    for client in clients:
+        writer = ExportWriter(f"{output_dir}/rows_{client.id}.csv")
+        writer.write(offboarding._export_rows(pages[client.id], client.name))
+        writer.close()
+    return time.perf_counter() - started
+
+
+def bench_decode(body):
+    """
+    Decode one large response body whole and streamed
+
+    Returns {name: (seconds, peak MB)}; the streamed decode reads the body in
+    STREAM_CHUNK_SIZE pieces like iter_pages does.
+    """
+    def whole():
+        return len(json.loads(body))
+
+    def streamed():
+        chunks = (body[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE))
+        return sum(1 for _ in iter_json_array(chunks))
+
+    results = {}
+    for name, decode in (("json.loads", whole), ("streaming", streamed)):
+        started = time.perf_counter()
+        decode()
+        seconds = time.perf_counter() - started
+        tracemalloc.start()
+        decode()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = (seconds, peak / 1024 / 1024)
+    return results
+
+
+def bench_pandas(pd, api_clients, pages, output_dir):
+    """The same work done the way the tool used to do it with pandas"""
+    started = time.perf_counter()
+    clients_df = pd.DataFrame(api_clients)
+    clients_df[clients_df['Name'].str.contains("client 01", case=False, na=False)]
+    for _, row in clients_df.iterrows():
+        df = pd.DataFrame(pages[row['Id']])
+        df['ClientId'] = df['Client'].apply(lambda x: x['ClientId'])
+        df['ClientName'] = row['Name']
+        df = df[EXPORT_COLUMNS]
+        df.to_csv(f"{output_dir}/pandas_{row['Id']}.csv", index=False)
+    return time.perf_counter() - started
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where it can't be measured"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 2 ** 20
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def start_mock_process(args):
+    """Run mock_automate_server.py on a free port; returns (process, base_url)"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_automate_server.py")
+    process = subprocess.Popen(
+        [sys.executable, script, "--port", str(port), "--clients", str(args.clients), "--rows", str(args.rows),
+         "--latency", str(args.latency), "--throttle-every", str(args.throttle_every),
+         "--expire-after", str(args.expire_after), "--rate-limit", str(args.rate_limit)],
+        stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("mock Automate server did not start")
+            time.sleep(0.05)
+
+
+def bench_end_to_end(args):
+    """Client list fetch plus export_passwords against the mock server; returns a result dict"""
+    process, base_url = start_mock_process(args)
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            offboarding = CWAOffboarding(base_url=base_url, output_dir=output_dir, pool_size=max(10, args.workers),
+                                         page_size=args.page_size, rate_control=not args.no_rate_control)
+
+            # The mock accepts any bearer token until --expire-after uses; a refresh just mints a new one
+            tokens = itertools.count(1)
+            refreshes = []
+            offboarding.set_credentials(f"bearer mock-{next(tokens)}", "mock")
+
+            def refresh():
+                refreshes.append(time.perf_counter())
+                offboarding.set_credentials(f"bearer mock-{next(tokens)}", "mock")
+                return True
+
+            offboarding.credential_refresher = refresh
+
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):
+                started = time.perf_counter()
+                clients = offboarding.get_all_clients()
+                listed = time.perf_counter()
+                ok = bool(clients) and offboarding.export_passwords(clients, workers=args.workers,
+                                                                    combined=args.combined, output_format=args.format)
+                finished = time.perf_counter()
+    finally:
+        process.terminate()
+        process.wait()
+
+    if not ok:
+        print(log.getvalue()[-2000:])
+        raise RuntimeError("export against the mock server failed")
+
+    export_seconds = finished - listed
+    summary = offboarding.last_summary
+    stats = offboarding.get_request_stats()
+    latencies = offboarding.metrics.request_latencies
+    return {
+        "clients": len(clients),
+        "rows": summary["rows"],
+        "failed_clients": summary["failed"],
+        "client_list_s": round(listed - started, 4),
+        "export_s": round(export_seconds, 4),
+        "clients_per_s": round(len(clients) / export_seconds, 1),
+        "rows_per_s": round(summary["rows"] / export_seconds, 1),
+        "requests": stats["requests"],
+        "retries": stats["retries"],
+        "errors": stats["errors"],
+        "token_refreshes": len(refreshes),
+        "throttled": offboarding.rate_controller.throttled if offboarding.rate_controller else None,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the export pipeline on synthetic clients")
+    parser.add_argument("--clients", type=int, default=3000, help="Number of synthetic clients (default: 3000)")
+    parser.add_argument("--rows", type=int, default=10, help="Passwords per client (default: 10)")
+    parser.add_argument("--mock", action="store_true", help="Benchmark a full export against mock_automate_server.py")
+    parser.add_argument("--workers", type=int, default=4, help="--mock: clients exported in parallel (default: 4)")
+    parser.add_argument("--page-size", type=int, default=1000, help="--mock: rows per API page (default: 1000)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv", help="--mock: output format (default: csv)")
+    parser.add_argument("--combined", action="store_true", help="--mock: write one combined file")
+    parser.add_argument("--latency", type=float, default=0.0, help="--mock: seconds of server latency per request (default: 0)")
+    parser.add_argument("--throttle-every", type=int, default=0, help="--mock: answer every Nth request with 429")
+    parser.add_argument("--expire-after", type=int, default=0, help="--mock: requests per bearer token before a 401")
+    parser.add_argument("--rate-limit", type=int, default=0, help="--mock: requests per second the server allows before 429s")
+    parser.add_argument("--no-rate-control", action="store_true", help="--mock: disable adaptive rate control")
+    parser.add_argument("--json", action="store_true", help="--mock: print the results as JSON")
+    args = parser.parse_args()
+
+    if args.mock:
+        result = bench_end_to_end(args)
+        if args.json:
+            print(json.dumps(result))
+            return
+        print(f"\n{result['clients']} clients x {args.rows} passwords, {args.workers} worker(s), "
+              f"{args.latency * 1000:.0f} ms latency\n")
+        for key, value in result.items():
+            print(f"{key:<20}{value:>14}")
+        return
+
+    api_clients = synthetic_clients(args.clients)
+    pages = {row["Id"]: synthetic_passwords(row["Id"], args.rows) for row in api_clients}
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        offboarding = CWAOffboarding(base_url="https://bench.invalid", output_dir=output_dir)
+
+        results = [("row pipeline", bench_rows(offboarding, api_clients, pages, output_dir))]
+
+        try:
+            import pandas as pd
+        except ImportError:
+            pd = None
+            print("pandas is not installed - skipping the pandas comparison")
+        if pd is not None:
+            results.append(("pandas", bench_pandas(pd, api_clients, pages, output_dir)))
+
+    print(f"\n{args.clients} clients x {args.rows} passwords\n")
+    print(f"{'pipeline':<24}{'total (s)':>12}{'per client (ms)':>18}")
+    for name, seconds in results:
+        print(f"{name:<24}{seconds:>12.3f}{seconds * 1000 / args.clients:>18.3f}")
+
+    if pd is not None:
+        print(f"\nRow pipeline speedup: {results[1][1] / results[0][1]:.1f}x")
+        print(f"pandas cold import: {time_import('pandas'):.3f} s (no longer paid at startup)")
+
+    body = json.dumps(list(itertools.chain.from_iterable(pages.values()))).encode()
+    print(f"\nDecoding all rows as one {len(body) / 1024 / 1024:.1f} MB response\n")
+    print(f"{'decoder':<24}{'total (s)':>12}{'peak (MB)':>18}")
+    for name, (seconds, peak) in bench_decode(body).items():
+        print(f"{name:<24}{seconds:>12.3f}{peak:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
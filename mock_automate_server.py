@@ -0,0 +1,301 @@
+"""
+Local stand-in for the ConnectWise Automate REST API, for offline testing and benchmarks
+
+Serves the endpoints the extractor uses, with synthetic data:
+    /cwa/api/v1/clients                          (paging, ETag / If-None-Match,
+                                                  condition=Id in (...) / Id = n)
+    /cwa/api/v1/clients/{id}
+    /cwa/api/v1/clients/{id}/deploymentlogins    (paging, includeFields,
+                                                  condition=Field like '%x%' /
+                                                  Field >= 'value', joined by "and")
+
+Faults can be injected to exercise the retry and re-authentication paths:
+    --latency / --jitter    per-request delay in seconds
+    --throttle-every N      every Nth request is answered 429 with Retry-After
+    --rate-limit N          requests beyond N in any one second are answered 429
+    --expire-after N        each bearer token stops working after N requests (401);
+                            any new "bearer ..." token gets a fresh budget
+    --max-page-size N       pageSize above N (or -1) is silently cut to N
+
+Usage:
+    python mock_automate_server.py --clients 500 --rows 20 --latency 0.02
+    python CW_Automate_PW_Extractor.py --base_url http://127.0.0.1:8765 --bearer_token "bearer mock" --clientid mock ...
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from email.utils import formatdate
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CLIENTS_ROUTE = re.compile(r'^/cwa/api/v1/clients/?$')
+CLIENT_ROUTE = re.compile(r'^/cwa/api/v1/clients/(\d+)/?$')
+DEPLOYMENT_LOGINS_ROUTE = re.compile(r'^/cwa/api/v1/clients/(\d+)/deploymentlogins/?$')
+
+
+class MockAutomateServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the synthetic tenant and the fault-injection settings
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 8765), clients=100, rows=10, latency=0.0, jitter=0.0,
+                 throttle_every=0, retry_after=0, expire_after=0, rate_limit=0, max_page_size=0, seed=1):
+        super().__init__(address, MockAutomateHandler)
+        self.client_count = clients
+        self.rows = rows
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.expire_after = expire_after
+        self.rate_limit = rate_limit
+        self.max_page_size = max_page_size
+        self.recent = deque()  # Arrival times within the last second (--rate-limit)
+        self.random = random.Random(seed)
+        self.started = formatdate(time.time(), usegmt=True)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.unauthorized = 0
+        self.token_uses = {}
+
+        self.clients_body = json.dumps([self.client_row(i) for i in range(1, clients + 1)]).encode()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self, authorization):
+        """
+        Count a request and decide whether it is throttled or unauthorized
+
+        Returns None to serve the request, or the error status to answer with.
+        """
+        with self.lock:
+            self.requests += 1
+            if self.throttle_every and self.requests % self.throttle_every == 0:
+                self.throttled += 1
+                return 429
+            if self.rate_limit:
+                now = time.monotonic()
+                while self.recent and now - self.recent[0] >= 1:
+                    self.recent.popleft()
+                if len(self.recent) >= self.rate_limit:
+                    self.throttled += 1
+                    return 429
+                self.recent.append(now)
+            if not authorization or not authorization.lower().startswith('bearer '):
+                self.unauthorized += 1
+                return 401
+            uses = self.token_uses.get(authorization, 0) + 1
+            self.token_uses[authorization] = uses
+            if self.expire_after and uses > self.expire_after:
+                self.unauthorized += 1
+                return 401
+            return None
+
+    def delay(self):
+        """Simulated server/network latency for one request"""
+        if self.latency or self.jitter:
+            with self.lock:
+                extra = self.random.uniform(0, self.jitter) if self.jitter else 0
+            time.sleep(self.latency + extra)
+
+    @lru_cache(maxsize=4096)
+    def deployment_logins(self, client_id):
+        """Synthetic deploymentlogins rows for one client, as a list"""
+        return [
+            {
+                "Client": {"ClientId": client_id},
+                "Title": f"Login {n:03d}",
+                "Username": f"user{n}@client{client_id}.example.com",
+                "Password": f"P@ss-{client_id}-{n}-{hashlib.md5(f'{client_id}/{n}'.encode()).hexdigest()[:8]}",
+                "Notes": f"Synthetic login {n} for client {client_id}",
+                "Url": f"https://app{n}.client{client_id}.example.com",
+                "LastUpdated": f"2024-{n % 12 + 1:02d}-{n % 28 + 1:02d}T12:00:00",
+            }
+            for n in range(self.rows)
+        ]
+
+    def client_row(self, client_id):
+        return {"Id": client_id, "Name": f"Mock Client {client_id:05d}"}
+
+    def filter_clients(self, condition):
+        """
+        Client rows matching an Automate condition, or None if the condition is not understood
+
+        Understands the forms the extractor sends: "Id in (1,2,3)" and "Id = 5".
+        """
+        match = re.fullmatch(r'\s*Id\s+in\s*\(([\d\s,]*)\)\s*', condition, re.IGNORECASE)
+        if match:
+            wanted = {int(part) for part in match.group(1).split(',') if part.strip()}
+        else:
+            match = re.fullmatch(r'\s*Id\s*=\s*(\d+)\s*', condition, re.IGNORECASE)
+            if not match:
+                return None
+            wanted = {int(match.group(1))}
+        return [self.client_row(i) for i in sorted(wanted) if 1 <= i <= self.client_count]
+
+    @staticmethod
+    def filter_logins(rows, condition):
+        """
+        deploymentlogins rows matching an Automate condition, or None if the condition is not understood
+
+        Understands "Field like '%text%'" (case-insensitive) and "Field >= 'value'"
+        clauses joined by "and", with '' as an escaped quote.
+        """
+        clauses = re.findall(r"\s*(\w+)\s+(like|>=)\s+'((?:[^']|'')*)'\s*(?:and\b|$)", condition, re.IGNORECASE)
+        if not clauses or re.sub(r"\s+", "", condition.lower()) != re.sub(r"\s+", "", " and ".join(
+                f"{field} {op} '{value}'" for field, op, value in clauses).lower()):
+            return None
+        for field, op, value in clauses:
+            value = value.replace("''", "'")
+            if op.lower() == 'like':
+                needle = value.strip('%').lower()
+                rows = [row for row in rows if needle in str(row.get(field) or '').lower()]
+            else:
+                rows = [row for row in rows if str(row.get(field) or '') >= value]
+        return rows
+
+    @staticmethod
+    def project(rows, include_fields):
+        """Keep only the includeFields columns (case-insensitive) plus Client"""
+        wanted = {field.strip().lower() for field in include_fields.split(',')} | {'client'}
+        return [{key: value for key, value in row.items() if key.lower() in wanted} for row in rows]
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'throttled': self.throttled, 'unauthorized': self.unauthorized}
+
+
+class MockAutomateHandler(BaseHTTPRequestHandler):
+    """Request handler for MockAutomateServer"""
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body=b'', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.delay()
+
+        status = server.admit(self.headers.get('Authorization'))
+        if status == 429:
+            return self.send_json(429, b'{"message":"Too many requests"}', {'Retry-After': str(server.retry_after)})
+        if status == 401:
+            return self.send_json(401, b'{"message":"Unauthorized"}')
+
+        url = urlparse(self.path)
+        query = {key.lower(): values[0] for key, values in parse_qs(url.query).items()}
+        page_size = int(query.get('pagesize', -1))
+        page = int(query.get('page', 1))
+        if server.max_page_size and (page_size <= 0 or page_size > server.max_page_size):
+            page_size = server.max_page_size  # Like a server that silently caps pageSize
+
+        if CLIENTS_ROUTE.match(url.path) and query.get('condition'):
+            rows = server.filter_clients(query['condition'])
+            if rows is None:
+                return self.send_json(400, b'{"message":"Unsupported condition"}')
+            if page_size > 0:
+                rows = rows[(page - 1) * page_size:page * page_size]
+            return self.send_json(200, json.dumps(rows).encode())
+
+        if CLIENTS_ROUTE.match(url.path):
+            if page_size <= 0:
+                body = server.clients_body
+            else:
+                start = (page - 1) * page_size + 1
+                rows = [server.client_row(i) for i in range(start, min(start + page_size, server.client_count + 1))]
+                body = json.dumps(rows).encode()
+            # Each page has its own ETag, as with a real server
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            if self.headers.get('If-None-Match') == etag:
+                return self.send_json(304, headers={'ETag': etag})
+            return self.send_json(200, body, {'ETag': etag, 'Last-Modified': server.started})
+
+        match = CLIENT_ROUTE.match(url.path)
+        if match:
+            client_id = int(match.group(1))
+            if not 1 <= client_id <= server.client_count:
+                return self.send_json(404, b'{"message":"Client not found"}')
+            return self.send_json(200, json.dumps(server.client_row(client_id)).encode())
+
+        match = DEPLOYMENT_LOGINS_ROUTE.match(url.path)
+        if match:
+            client_id = int(match.group(1))
+            if not 1 <= client_id <= server.client_count:
+                return self.send_json(404, b'{"message":"Client not found"}')
+            rows = server.deployment_logins(client_id)
+            if query.get('condition'):
+                rows = server.filter_logins(rows, query['condition'])
+                if rows is None:
+                    return self.send_json(400, b'{"message":"Unsupported condition"}')
+            if query.get('includefields'):
+                rows = server.project(rows, query['includefields'])
+            if page_size > 0:
+                rows = rows[(page - 1) * page_size:page * page_size]
+            return self.send_json(200, json.dumps(rows).encode())
+
+        self.send_json(404, b'{"message":"Not found"}')
+
+
+def start_mock_server(port=0, **settings):
+    """
+    Start a MockAutomateServer on a background thread (port 0 picks a free port)
+
+    Returns the server; call shutdown() when done.
+    """
+    server = MockAutomateServer(('127.0.0.1', port), **settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the ConnectWise Automate API")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--clients", type=int, default=100, help="Number of clients (default: 100)")
+    parser.add_argument("--rows", type=int, default=10, help="Passwords per client (default: 10)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request (default: 0)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra latency, up to this many seconds (default: 0)")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth request with 429 (default: never)")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Requests allowed per second before 429s (default: unlimited)")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with 429 (default: 0)")
+    parser.add_argument("--expire-after", type=int, default=0, help="Requests each bearer token is good for before 401 (default: unlimited)")
+    parser.add_argument("--max-page-size", type=int, default=0, help="Largest pageSize honoured; bigger pages are cut to it (default: no cap)")
+    args = parser.parse_args()
+
+    server = MockAutomateServer(('127.0.0.1', args.port), clients=args.clients, rows=args.rows,
+                                latency=args.latency, jitter=args.jitter, throttle_every=args.throttle_every,
+                                retry_after=args.retry_after, expire_after=args.expire_after,
+                                rate_limit=args.rate_limit, max_page_size=args.max_page_size)
+    print(f"Mock Automate API with {args.clients} clients x {args.rows} passwords on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served: {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
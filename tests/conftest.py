@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The tool is a single script in the repository root; make it importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CW_Automate_PW_Extractor import CWAOffboarding  # noqa: E402
+from mock_automate_server import start_mock_server  # noqa: E402
+
+
+@pytest.fixture
+def connect(tmp_path):
+    """Start a mock Automate server with the given settings; returns (server, CWAOffboarding logged in to it)"""
+    servers = []
+
+    def connect(page_size=100, **settings):
+        server = start_mock_server(**settings)
+        servers.append(server)
+        offboarding = CWAOffboarding(base_url=server.base_url, output_dir=str(tmp_path / 'exports'),
+                                     page_size=page_size, max_retries=0)
+        offboarding.set_credentials('bearer test', 'test')
+        return server, offboarding
+
+    yield connect
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,77 @@
+import json
+
+from CW_Automate_PW_Extractor import DeltaIndex
+
+BASE_URL = 'https://automate.example.com'
+
+
+def login(title, password, username='admin', url='https://router.local'):
+    return ('Acme', 7, title, username, password, 'note', url)
+
+
+def export(index, pages, client_id=7):
+    """One --delta export of a client: (changed rows, removed rows), then remember the new state"""
+    previous = index.previous(client_id)
+    current = {}
+    changes = []
+    for rows in pages:
+        changes.extend(index.diff(rows, previous, current))
+    removed = index.removed(previous, current, 'Acme', client_id)
+    index.update(client_id, current)
+    return changes, removed
+
+
+# Three logins share Title/Username/Url and differ only in their password
+DUPLICATES = [login('Router', 'one'), login('Router', 'two'), login('Router', 'three'), login('Switch', 'sw')]
+
+
+def test_duplicates_are_all_added_then_unchanged(tmp_path):
+    index = DeltaIndex(tmp_path, BASE_URL)
+    changes, removed = export(index, [DUPLICATES])
+    assert [change[0] for change in changes] == ['added'] * 4
+    assert [change[1:] for change in changes] == DUPLICATES
+    assert removed == []
+
+    assert export(index, [DUPLICATES]) == ([], [])
+
+
+def test_changed_duplicate_is_the_only_change(tmp_path):
+    index = DeltaIndex(tmp_path, BASE_URL)
+    export(index, [DUPLICATES])
+
+    rows = list(DUPLICATES)
+    rows[1] = login('Router', 'TWO')
+    assert export(index, [rows]) == ([('changed',) + rows[1]], [])
+
+
+def test_dropped_and_added_duplicates(tmp_path):
+    index = DeltaIndex(tmp_path, BASE_URL)
+    export(index, [DUPLICATES])
+
+    changes, removed = export(index, [DUPLICATES[:2] + DUPLICATES[3:]])
+    assert changes == []
+    assert removed == [('removed', 'Acme', 7, 'Router', 'admin', None, None, 'https://router.local')]
+
+    changes, removed = export(index, [DUPLICATES + [login('Router', 'four')]])
+    assert changes == [('added',) + DUPLICATES[2], ('added',) + login('Router', 'four')]
+    assert removed == []
+
+
+def test_duplicates_split_across_pages(tmp_path):
+    index = DeltaIndex(tmp_path, BASE_URL)
+    export(index, [DUPLICATES])
+    assert export(index, [DUPLICATES[:1], DUPLICATES[1:3], DUPLICATES[3:]]) == ([], [])
+
+
+def test_saved_index_is_reloaded_without_passwords(tmp_path):
+    index = DeltaIndex(tmp_path, BASE_URL)
+    export(index, [DUPLICATES])
+    index.save()
+
+    stored = (tmp_path / DeltaIndex.FILENAME).read_text(encoding='utf-8')
+    assert 'three' not in stored
+    assert list(json.loads(stored)['servers']) == [BASE_URL]
+
+    reloaded = DeltaIndex(tmp_path, BASE_URL)
+    assert export(reloaded, [DUPLICATES]) == ([], [])
+    assert export(DeltaIndex(tmp_path, 'https://other.example.com'), [DUPLICATES[:1]])[0][0][0] == 'added'
@@ -0,0 +1,137 @@
+import os
+import struct
+
+import pytest
+
+from CW_Automate_PW_Extractor import CWAOffboarding, ExportEncryption, ExportWriter
+
+PASSPHRASE = 'correct horse battery staple'
+
+
+@pytest.fixture(scope='module')
+def encryption():
+    encryption = ExportEncryption(PASSPHRASE)
+    encryption.CHUNK_SIZE = 64  # Many chunks from a small file
+    return encryption
+
+
+def encrypt(encryption, path, data):
+    with open(path, 'wb') as raw:
+        sink = encryption.open(raw)
+        sink.write(data)
+        sink.close()
+
+
+def chunk_offsets(data):
+    """Offsets of the length-prefixed chunks after the header"""
+    offsets, pos = [], ExportEncryption._HEADER.size
+    while pos < len(data):
+        offsets.append(pos)
+        pos += 4 + struct.unpack('>I', data[pos:pos + 4])[0]
+    return offsets
+
+
+@pytest.mark.parametrize('size', [0, 1, 63, 64, 65, 1000])
+def test_round_trip(tmp_path, encryption, size):
+    data = os.urandom(size)
+    encrypt(encryption, tmp_path / 'data.enc', data)
+    ExportEncryption.decrypt_file(tmp_path / 'data.enc', tmp_path / 'data', PASSPHRASE)
+    assert (tmp_path / 'data').read_bytes() == data
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'jsonl.gz', 'parquet'])
+def test_encrypted_export_decrypts_to_plain_export(tmp_path, output_format):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    rows = [('Client é', 7, f'Title {i}', 'user', 'p@ss,"word"', None, 'https://example.com') for i in range(500)]
+    for name, encryption in (('plain', None), ('secret', ExportEncryption(PASSPHRASE))):
+        writer = ExportWriter(str(tmp_path / f'{name}.{output_format}'), output_format, encryption=encryption)
+        writer.write(rows)
+        writer.close()
+    assert b'Title 1' not in (tmp_path / f'secret.{output_format}').read_bytes()
+
+    ExportEncryption.decrypt_file(tmp_path / f'secret.{output_format}', tmp_path / 'decrypted', PASSPHRASE)
+    if output_format == 'parquet':
+        import pyarrow.parquet
+        assert pyarrow.parquet.read_table(tmp_path / 'decrypted').equals(pyarrow.parquet.read_table(tmp_path / f'plain.{output_format}'))
+    elif output_format == 'jsonl.gz':
+        import gzip
+        assert gzip.decompress((tmp_path / 'decrypted').read_bytes()) == gzip.decompress((tmp_path / f'plain.{output_format}').read_bytes())
+    else:
+        assert (tmp_path / 'decrypted').read_bytes() == (tmp_path / f'plain.{output_format}').read_bytes()
+
+
+DAMAGE = ['flipped ciphertext bit', 'flipped header bit', 'last chunk dropped', 'cut inside a chunk',
+          'header only', 'chunks swapped', 'chunk removed', 'data appended']
+
+
+def tampered(data, damage):
+    """A copy of an encrypted file with the given kind of damage"""
+    offsets = chunk_offsets(data)
+    flipped = bytearray(data)
+    flipped[offsets[1] + 10] ^= 1
+    header = bytearray(data)
+    header[20] ^= 1
+    return {
+        'flipped ciphertext bit': bytes(flipped),
+        'flipped header bit': bytes(header),
+        'last chunk dropped': data[:offsets[-1]],
+        'cut inside a chunk': data[:offsets[2] + 7],
+        'header only': data[:offsets[0]],
+        'chunks swapped': data[:offsets[1]] + data[offsets[2]:offsets[3]] + data[offsets[1]:offsets[2]] + data[offsets[3]:],
+        'chunk removed': data[:offsets[1]] + data[offsets[2]:],
+        'data appended': data + b'\x00',
+    }[damage]
+
+
+@pytest.mark.parametrize('damage', DAMAGE)
+def test_damaged_file_is_rejected(tmp_path, encryption, damage):
+    encrypt(encryption, tmp_path / 'data.enc', os.urandom(1000))
+    (tmp_path / 'bad.enc').write_bytes(tampered((tmp_path / 'data.enc').read_bytes(), damage))
+
+    with pytest.raises(ValueError):
+        ExportEncryption.decrypt_file(tmp_path / 'bad.enc', tmp_path / 'data', PASSPHRASE)
+    assert not (tmp_path / 'data').exists()
+
+
+def test_wrong_passphrase_is_rejected(tmp_path, encryption):
+    encrypt(encryption, tmp_path / 'data.enc', b'secret rows')
+    with pytest.raises(ValueError):
+        ExportEncryption.decrypt_file(tmp_path / 'data.enc', tmp_path / 'data', 'wrong ' + PASSPHRASE)
+    assert not (tmp_path / 'data').exists()
+
+
+def test_plain_file_is_rejected(tmp_path):
+    (tmp_path / 'data.csv').write_bytes(b'ClientName,ClientId\n')
+    with pytest.raises(ValueError):
+        ExportEncryption.decrypt_file(tmp_path / 'data.csv', tmp_path / 'data', PASSPHRASE)
+
+
+def test_xlsx_cannot_be_encrypted(tmp_path):
+    with pytest.raises(ValueError):
+        ExportWriter(str(tmp_path / 'data.xlsx'), 'xlsx', encryption=ExportEncryption(PASSPHRASE))
+
+
+def test_explicit_output_names_get_the_enc_suffix():
+    split = CWAOffboarding._split_filename
+    assert split('audit.csv', 'csv.enc') == ('audit', 'csv.enc')
+    assert split('audit', 'csv.enc') == ('audit', 'csv.enc')
+    assert split('audit.jsonl.gz', 'jsonl.gz.enc') == ('audit', 'jsonl.gz.enc')
+    assert split('audit.csv.enc', 'csv.enc') == ('audit', 'csv.enc')
+    assert split('audit.txt', 'csv.enc') == ('audit', 'txt.enc')
+    assert split('audit.csv', 'csv') == ('audit', 'csv')
+
+
+@pytest.mark.parametrize('combined', [False, True])
+def test_explicit_output_file_is_encrypted_under_enc_name(connect, combined):
+    _, offboarding = connect(clients=2, rows=3)
+    clients = offboarding.get_clients_by_id([1, 2] if combined else [1])
+    assert offboarding.export_passwords(clients, output_file='audit.csv', combined=combined,
+                                        encryption=ExportEncryption(PASSPHRASE))
+
+    exported = offboarding.last_summary['files']
+    assert [os.path.basename(path) for path in exported] == ['audit.csv.enc']
+    assert not os.path.exists(os.path.join(offboarding.output_dir, 'audit.csv'))
+    ExportEncryption.decrypt_file(exported[0], os.path.join(offboarding.output_dir, 'audit.csv'), PASSPHRASE)
+    with open(os.path.join(offboarding.output_dir, 'audit.csv'), encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == 1 + 3 * len(clients)
@@ -0,0 +1,64 @@
+import os
+import threading
+
+import CW_Automate_PW_Extractor as extractor
+
+
+def export(offboarding, client_ids, **options):
+    """Run export_passwords in a thread; fails the test instead of hanging if it never returns"""
+    clients = offboarding.get_clients_by_id(client_ids)
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.setdefault('ok', offboarding.export_passwords(clients, **options)),
+                              daemon=True)
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive(), "export_passwords hung"
+    return outcome['ok']
+
+
+def test_failed_journal_write_fails_only_that_client(connect, monkeypatch):
+    _, offboarding = connect(clients=3, rows=5)
+    record = extractor.ExportJournal.record
+    calls = []
+
+    def flaky_record(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise OSError(28, "No space left on device")
+        return record(self, *args, **kwargs)
+
+    monkeypatch.setattr(extractor.ExportJournal, 'record', flaky_record)
+    assert export(offboarding, [1, 2, 3], workers=1)
+    assert offboarding.last_summary['exported'] == 2
+    assert offboarding.last_summary['failed'] == 1
+
+
+def test_failed_close_fails_only_that_client(connect, monkeypatch):
+    _, offboarding = connect(clients=3, rows=5)
+    close = extractor.ExportWriter.close
+
+    def flaky_close(self, finalize=True):
+        if finalize and 'Client_00002' in str(self.requested_file):
+            raise RuntimeError("encoder broke")
+        return close(self, finalize)
+
+    monkeypatch.setattr(extractor.ExportWriter, 'close', flaky_close)
+    assert export(offboarding, [1, 2, 3], workers=2)
+    assert offboarding.last_summary['failed'] == 1
+    assert sorted(os.listdir(offboarding.output_dir)) == sorted(
+        [os.path.basename(path) for path in offboarding.last_summary['files']] + [extractor.ExportJournal.FILENAME])
+
+
+def test_unexpected_write_stage_error_fails_only_that_client(connect, monkeypatch):
+    _, offboarding = connect(clients=4, rows=5)
+    write_item = extractor.ExportPipeline._write_item
+
+    def flaky_write_item(self, kind, index, payload, rows_written):
+        if kind == 'done' and index == 1:
+            raise KeyError('passwords')
+        return write_item(self, kind, index, payload, rows_written)
+
+    monkeypatch.setattr(extractor.ExportPipeline, '_write_item', flaky_write_item)
+    assert export(offboarding, [1, 2, 3, 4], workers=2)
+    assert offboarding.last_summary['exported'] == 3
+    assert offboarding.last_summary['failed'] == 1
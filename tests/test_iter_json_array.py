@@ -0,0 +1,65 @@
+import json
+import random
+
+import pytest
+
+from CW_Automate_PW_Extractor import iter_json_array
+
+
+def random_value(rng, depth=0):
+    """A random JSON value, biased towards the tricky parts: numbers, escapes and non-ASCII text"""
+    kinds = ['int', 'float', 'string', 'literal'] + (['list', 'object'] if depth < 3 else [])
+    kind = rng.choice(kinds)
+    if kind == 'int':
+        return rng.choice([0, -1, 7, 12345678901234567890, -rng.randrange(10 ** 6)])
+    if kind == 'float':
+        return rng.choice([0.5, -2.25, 1e-7, 6.02e23, rng.uniform(-1e6, 1e6)])
+    if kind == 'string':
+        alphabet = 'ab "\\/\n\t\u00e9\u20ac\U0001f511,]}['
+        return ''.join(rng.choice(alphabet) for _ in range(rng.randrange(12)))
+    if kind == 'literal':
+        return rng.choice([True, False, None])
+    if kind == 'list':
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f"k{i}\u00fc": random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+
+
+def split(data, rng):
+    """Cut bytes at random points, often in the middle of a number, escape or UTF-8 sequence"""
+    chunks, pos = [], 0
+    while pos < len(data):
+        size = rng.choice([1, 1, 2, 3, 5, 8, 64])
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return chunks
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_matches_json_loads_for_any_chunking(seed):
+    rng = random.Random(seed)
+    document = [random_value(rng) for _ in range(rng.randrange(6))]
+    text = json.dumps(document, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]),
+                      separators=rng.choice([None, (',', ':'), (' , ', ' : ')]))
+    data = text.encode('utf-8')
+
+    assert list(iter_json_array(split(data, rng))) == json.loads(text)
+
+
+def test_every_two_chunk_split():
+    text = '[12.5e-3, -0, "a\\"\\u00e9\u20ac", {"x": [1, 2]}, true, null, 1E+2]'
+    data = text.encode('utf-8')
+    for cut in range(len(data) + 1):
+        assert list(iter_json_array([data[:cut], data[cut:]])) == json.loads(text), cut
+
+
+def test_truncated_array_is_rejected():
+    data = '[{"Title": "a\u20ac"}, 123.5, "b"]'.encode('utf-8')
+    for cut in range(len(data)):
+        with pytest.raises(ValueError):
+            list(iter_json_array([data[:cut]]))
+
+
+@pytest.mark.parametrize('text', ['{"a": 1}', '[1 2]', '[1,]', '[1] x', '[1.]', '[tru]'])
+def test_malformed_body_is_rejected(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(bytes([b]) for b in text.encode('utf-8')))
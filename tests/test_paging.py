@@ -0,0 +1,53 @@
+import pytest
+import requests
+
+from CW_Automate_PW_Extractor import CLIENTS_PATH, ClientListCache, LoginQuery
+
+
+def logins(offboarding, client_id=1):
+    return [row for rows in offboarding.iter_pages(LoginQuery().path(client_id)) for row in rows]
+
+
+@pytest.mark.parametrize('cap, rows', [(300, 700), (10, 25), (7, 7), (99, 1)])
+def test_page_size_cap_loses_no_rows(connect, cap, rows):
+    _, offboarding = connect(page_size=1000, clients=3, rows=rows, max_page_size=cap)
+    assert len(logins(offboarding)) == rows
+    assert offboarding.page_size == (cap if rows > cap else 1000)
+    assert [len(logins(offboarding, client_id)) for client_id in (2, 3)] == [rows, rows]
+
+
+def test_client_list_is_not_cut_short_by_a_cap(connect):
+    _, offboarding = connect(page_size=50, clients=45, rows=1, max_page_size=20)
+    assert [client.id for client in offboarding.get_all_clients()] == list(range(1, 46))
+
+
+def test_short_page_ends_paging_once_the_page_size_is_proven(connect):
+    server, offboarding = connect(page_size=10, clients=2, rows=25)
+    assert len(logins(offboarding, 1)) == 25  # Full pages prove the page size...
+    before = server.requests
+    assert len(logins(offboarding, 2)) == 25
+    assert server.requests - before == 3  # ...so the short third page is the last request
+
+
+
+def test_paged_client_list_ignores_a_cached_validator_for_page_one(connect, tmp_path):
+    server, offboarding = connect(page_size=2, clients=5, rows=1)
+    page_one = requests.get(f"{server.base_url}{CLIENTS_PATH}?page=1&pageSize=2", headers=offboarding.headers)
+    cache = ClientListCache(tmp_path / 'cache')
+    cache.save(server.base_url, offboarding.get_clients_by_id([1, 2]), {'etag': page_one.headers['ETag']})
+
+    # Page 1 is unchanged, but clients 3-5 on later pages are new
+    clients = offboarding._fetch_clients(cache, cache.load(server.base_url))
+    assert [client.id for client in clients] == [1, 2, 3, 4, 5]
+    assert [client.id for client in cache.load(server.base_url)['clients']] == [1, 2, 3, 4, 5]
+
+
+def test_unpaged_client_list_is_reused_when_unchanged(connect, tmp_path):
+    server, offboarding = connect(page_size=-1, clients=5, rows=1)
+    cache = ClientListCache(tmp_path / 'cache')
+    assert len(offboarding._fetch_clients(cache, None)) == 5
+    cached = cache.load(server.base_url)
+    assert cached['etag']
+
+    cached['clients'] = cached['clients'][:1]  # Only a 304 would bring this back unchanged
+    assert [client.id for client in offboarding._fetch_clients(cache, cached)] == [1]
@@ -0,0 +1,81 @@
+import time
+
+from CW_Automate_PW_Extractor import AdaptiveRateController
+
+
+def send(controller, status=200, latency=0.01, retry_after=None):
+    """One request through the controller with the given outcome"""
+    sent = controller.acquire()
+    controller.release(sent, latency=latency, status=status, retry_after=retry_after)
+
+
+def test_burst_of_429s_cuts_once():
+    controller = AdaptiveRateController(8)
+    sent = [controller.acquire() for _ in range(8)]
+    for started in sent:
+        controller.release(started, latency=0.01, status=429)
+
+    assert int(controller.limit) == 4
+    assert controller.decreases == 1
+    assert controller.throttled == 8
+    assert controller.rate == 4  # Half of what was being sent, as a token bucket
+    assert controller.paused_until > time.monotonic()
+
+
+def test_requests_sent_after_a_cut_can_cut_again():
+    controller = AdaptiveRateController(8)
+    controller.THROTTLE_PAUSE = 0
+    send(controller, 429)
+    send(controller, 429)
+    assert int(controller.limit) == 2
+    assert controller.decreases == 2
+
+
+def test_retry_after_pauses_all_requests():
+    controller = AdaptiveRateController(4)
+    send(controller, 503, retry_after=30)
+    assert controller.paused_until - time.monotonic() > 25
+
+
+def test_connection_error_cuts_without_pausing():
+    controller = AdaptiveRateController(4)
+    send(controller, None, latency=None)
+    assert int(controller.limit) == 2
+    assert controller.throttled == 0
+    assert controller.paused_until == 0
+
+
+def test_latency_rise_cuts_gently_and_recovers():
+    controller = AdaptiveRateController(8)
+    for _ in range(20):
+        send(controller, 200, 0.01)
+    assert controller.limit == 8
+
+    for _ in range(3):
+        send(controller, 200, 1.0)
+    assert 1 < controller.limit < 8
+    assert controller.rate is None  # Slow responses alone don't start rate limiting
+
+    for _ in range(300):
+        send(controller, 200, 0.01)
+    assert controller.limit == 8
+    assert controller.increases >= 1
+
+
+def test_max_rps_paces_requests():
+    controller = AdaptiveRateController(4, max_rps=50)
+    started = time.monotonic()
+    for _ in range(11):
+        send(controller)
+    assert time.monotonic() - started >= 0.9 * 10 / 50
+    assert controller.rate <= 50
+
+
+def test_cancel_frees_the_slot():
+    controller = AdaptiveRateController(1)
+    controller.acquire()
+    controller.cancel()
+    assert controller.in_flight == 0
+    send(controller)
+    summary = controller.to_dict()
+    assert summary['limit'] == 1 and summary['throttled'] == 0
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from CW_Automate_PW_Extractor import EXIT_AUTH_FAILED, EXIT_SERVER_UNREACHABLE, CWAOffboarding, TokenCache
+from mock_automate_server import start_mock_server
+
+pytest.importorskip('cryptography')
+
+
+@pytest.fixture
+def unreachable_url():
+    """Base URL of a port nothing listens on any more"""
+    server = start_mock_server()
+    base_url = server.base_url
+    server.shutdown()
+    server.server_close()
+    return base_url
+
+
+def cached(tmp_path, base_url, token):
+    cache = TokenCache(cache_dir=tmp_path / 'cache')
+    cache.put(base_url, token, 'client')
+    offboarding = CWAOffboarding(base_url=base_url, output_dir=str(tmp_path / 'exports'), max_retries=0)
+    return cache, offboarding
+
+
+def test_working_token_is_used(tmp_path, connect):
+    server, _ = connect()
+    cache, offboarding = cached(tmp_path, server.base_url, 'bearer good')
+    assert offboarding.load_cached_credentials(cache)
+    assert offboarding.validate_credentials() is True
+
+
+def test_rejected_token_is_evicted(tmp_path, connect):
+    server, _ = connect()
+    cache, offboarding = cached(tmp_path, server.base_url, 'not a bearer token')
+    assert not offboarding.load_cached_credentials(cache)
+    assert cache.get(server.base_url) is None
+    assert offboarding.headers is None
+
+
+def test_unreachable_server_keeps_the_cached_token(tmp_path, unreachable_url):
+    cache, offboarding = cached(tmp_path, unreachable_url, 'bearer good')
+    offboarding.set_credentials('bearer good', 'client')
+    assert offboarding.validate_credentials() is None
+
+    assert offboarding.load_cached_credentials(cache)
+    assert cache.get(unreachable_url)['authorization'] == 'bearer good'
+
+
+def run_cli(tmp_path, base_url, token):
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'CW_Automate_PW_Extractor.py')
+    return subprocess.run([sys.executable, script, '--non-interactive', '--base_url', base_url, '--bearer_token', token,
+                           '--clientid', 'client', '--client-ids', '1', '--no-token-cache', '--retries', '0',
+                           '--output_dir', str(tmp_path)], capture_output=True, timeout=120).returncode
+
+
+def test_cli_unreachable_server_is_not_an_auth_failure(tmp_path, unreachable_url):
+    assert run_cli(tmp_path, unreachable_url, 'bearer good') == EXIT_SERVER_UNREACHABLE
+
+
+def test_cli_rejected_token_is_an_auth_failure(tmp_path, connect):
+    server, _ = connect()
+    assert run_cli(tmp_path, server.base_url, 'not a bearer token') == EXIT_AUTH_FAILED